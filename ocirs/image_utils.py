@@ -1,33 +1,80 @@
-import re
 import cv2
-import pytesseract
 import numpy as np
 
+from ocirs.ocr_backends import get_ocr_backend
 
 
-def table_preprocess(image):
+
+###############################
+# Image contract used throughout ocirs: page and table images are single channel (greyscale)
+# uint8 numpy arrays of shape (height, width), as returned by
+# `cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)`. Functions here take and return images in that
+# form, and only convert color images passed in from outside ocirs
+###############################
+
+#Right angle rotations, keyed by tesseract's "Rotate:" degrees. cv2.rotate transposes the pixels
+# without interpolation
+RIGHT_ANGLE_ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE
+}
+
+
+def as_grayscale(image):
+    '''Returns an image as a single channel uint8 array
+
+    Greyscale images are returned as is, without a copy. 3 channel (BGR) and 4 channel (BGRA)
+    images are converted.
+
+    :param image: image loaded through cv2
+    :type image: numpy array
+
+    :returns: image of shape (height, width) and dtype uint8
+    :rtype: numpy array
+    '''
+    if image.dtype != np.uint8:
+        raise TypeError(f"Images must have dtype uint8. Recieved {image.dtype}")
+
+    if image.ndim == 2:
+        return image
+    if image.ndim == 3 and image.shape[2] == 1:
+        return image[:, :, 0]
+    if image.ndim == 3 and image.shape[2] == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if image.ndim == 3 and image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+
+    raise ValueError(f"Images must have 1, 3 or 4 channels. Recieved an image of shape {image.shape}")
+
+
+def table_preprocess(image, orientation=None):
     '''
     Loads an image from path using cv2
     Uses pytesseract to rotate image to correct orientation
     Greyscales the rotated image
     And threshold the image to binary values
+
+    If the image's orientation is already known (see `detect_orientation()`), pass it to skip
+    orientation detection
+
+    Returns a new single channel uint8 image. The input image is never modified
     '''
 
     #Load image
     # original_image = cv2.imread(image_path)
-    original_image = image
-    # cv2.imwrite("image_original.jpg",original_image)
+    #Greyscale image. Greyscale pages are used as is
+    greyscaled_image = as_grayscale(image)
+    # cv2.imwrite("image_greyscaled.jpg",greyscaled_image)
 
     #Rotate image
-    rotated_image = rotate_image(original_image)
+    rotated_image = rotate_image(greyscaled_image, orientation)
     # cv2.imwrite("image_rotated.jpg",rotated_image)
 
-    #Greyscale image
-    greyscaled_image = cv2.cvtColor(rotated_image, cv2.COLOR_BGR2GRAY)
-    # cv2.imwrite("image_greyscaled.jpg",greyscaled_image)
-
-    #Threshold image
-    thresh, thresholded_image = cv2.threshold(greyscaled_image,128,255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    #Threshold image. Threshold in place when rotation or greyscaling already made a copy
+    thresholded_image = None if np.shares_memory(rotated_image, image) else rotated_image
+    thresh, thresholded_image = cv2.threshold(rotated_image,128,255, cv2.THRESH_BINARY | cv2.THRESH_OTSU,
+                                                dst=thresholded_image)
     # cv2.imwrite("image_thresholded.jpg",thresholded_image)
 
     
@@ -36,21 +83,40 @@ def table_preprocess(image):
     return preprocessed_image
 
 
-def rotate_image(image):
+def detect_orientation(image):
+    '''Use tesseract's orientation and script detection, run by the ocirs ocr backend (see
+    `ocirs.ocr_backends`), to find how far an image is rotated
+
+    :returns: degrees the image must be rotated to be right-way up, as reported by tesseract's
+        "Rotate:" field. 0 for upright images
+    :rtype: int
+    '''
+    return get_ocr_backend().detect_orientation(as_grayscale(image))
+
+
+def rotate_image(image, orientation=None):
     '''Use cv2 and pytesseract to rotate image right-way up
+
+    `orientation` is the output of `detect_orientation()`. It's detected here if not provided.
+    Upright images (orientation 0) are returned as is, without any conversion. Images keep their
+    number of channels
     '''
+    if orientation is None:
+        orientation = detect_orientation(image)
 
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    orientation = orientation % 360
+    if orientation == 0:
+        return image
+    if orientation in RIGHT_ANGLE_ROTATIONS:
+        return cv2.rotate(image, RIGHT_ANGLE_ROTATIONS[orientation])
 
-    # Angle solution from
-    # https://stackoverflow.com/questions/55119504/is-it-possible-to-check-orientation-of-an-image-before-passing-it-through-pytess
-    angle = 360-int(re.search('(?<=Rotate: )\d+', pytesseract.image_to_osd(rgb_image)).group(0))
+    angle = 360-orientation
 
     #Rotate image using cv2 from
     # https://stackoverflow.com/questions/11764575/python-2-7-3-opencv-2-4-after-rotation-window-doesnt-fit-image
 
     #Get image height, width, center and set scale
-    (h, w) = rgb_image.shape[:2]
+    (h, w) = image.shape[:2]
     center = (w / 2, h / 2)
     scale = 1.0
 
@@ -65,18 +131,19 @@ def rotate_image(image):
     rotation_matrix[0,2] += t_x #third column of matrix holds translation, effects after rotation.
     rotation_matrix[1,2] += t_y
 
-    rotated_image = cv2.warpAffine(rgb_image, rotation_matrix, dsize=(int(new_w),int(new_h)))
+    rotated_image = cv2.warpAffine(image, rotation_matrix, dsize=(int(new_w),int(new_h)))
 
     return rotated_image
 
 
 def ocr_preprocess(image):
     '''Preprocessing for an image for pytesseract after it is already loaded through cv2
+
+    Returns a new, thresholded single channel uint8 image. Tesseract reads greyscale images
+    directly, so no color conversion is needed
     '''
 
-    ret3, thresholded_image = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
-    # cv2.imwrite("thresholded.jpg",thresholded_image)
-    ocr_image = cv2.cvtColor(thresholded_image, cv2.COLOR_BGR2RGB)
-    # cv2.imwrite("greyscale.jpg",tesseract_image)
+    ret3, ocr_image = cv2.threshold(as_grayscale(image), 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    # cv2.imwrite("thresholded.jpg",ocr_image)
 
     return ocr_image
@@ -1,19 +1,65 @@
 import pathlib
-import tempfile #For temporarily storing image files
 import time # For timestamping saved files
+import concurrent.futures #For ocr'ing pages concurrently
 
 from tqdm import tqdm #For displaying helpful progress bars
-from pdf2image import convert_from_path #pdf to image handling
 import fuzzysearch #Fuzzysearch for identifying form componenets via search_phrases.
+import pytesseract
+import cv2
 
 #Class for individual nine ninety pages
 from ocirs.nineninetypage import NineNinetyPage
+from ocirs.image_utils import ocr_preprocess
+#Cache of ocr results, keyed on image content and tesseract config
+from ocirs import ocr_cache
+#On-disk cache of rasterized pdf pages
+from ocirs.raster_cache import RasterCache
+from ocirs import raster_cache
+#Multi-pattern matcher for searching every form component at once, and a cheap prefilter
+from ocirs.phrase_index import PhraseIndex, QGramFilter
+#Single file columnar storage of ocr data
+from ocirs.ocr_store import OCR_STORE_EXTENSIONS, write_ocr_store, read_ocr_store
 #method for merging a list of similar dataframes
 from ocirs.table_extraction.table_merge import merge_dataframes
 #module for validating user inputs
 import ocirs.validation_utils as validation_utils
 
 
+def _ocr_page(index, image_path):
+    '''Worker function used by `NineNinetyForm.extract_pages()` to ocr a single page image.
+
+    Defined at module level so it can be pickled and sent to a process pool. Only the ocr
+    dataframe is sent back to the parent process, the page image is reloaded there.
+
+    :returns: tuple of the page index and its pytesseract.Output.DATAFRAME of ocr data
+    :rtype: tuple
+    '''
+    page = NineNinetyPage(image_path=image_path, data_path=None, index=index)
+    return index, page.ocr_dataframe
+
+
+#psm 3 skips orientation detection. Header strips only need a quick read, not a full page layout
+HEADER_PYTESSERACT_CONFIG = "--oem 3 --psm 3"
+
+def _ocr_page_header(index, image_path, header_fraction):
+    '''Worker function used by `NineNinetyForm.search_form(search_mode="header")` to ocr the top
+    strip of a (low resolution) page image.
+
+    :returns: tuple of the page index and the header strip's text
+    :rtype: tuple
+    '''
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    header_image = image[:max(1, int(image.shape[0] * header_fraction))]
+
+    ocr_dataframe = ocr_cache.image_to_data(
+        ocr_preprocess(header_image),
+        output_type=pytesseract.Output.DATAFRAME,
+        config=HEADER_PYTESSERACT_CONFIG
+    )
+
+    return index, NineNinetyPage.dataframe_to_text(ocr_dataframe)
+
+
 class NineNinetyForm():
 
     '''A class for processing scanned IRS form 990s
@@ -112,7 +158,21 @@ class NineNinetyForm():
         }
     }
 
-    def __init__(self, pdf_path, form_type, org_name=None, tax_period=None):
+    ###################################################################################
+    # Class variables for `search_form(search_mode="header")`. The top `header_search_fraction`
+    # of every page, rendered at `header_search_dpi`, is ocr'ed to find candidate pages
+    ###################################################################################
+    header_search_fraction = 0.3
+    header_search_dpi = 150
+
+    ###################################################################################
+    # Q-gram prefilter run by `phrase_match()` before each fuzzysearch. Pages that can't hold a
+    # match are skipped. `phrase_prefilter.hits` and `phrase_prefilter.rejects` count how many
+    # phrase searches passed and were skipped
+    ###################################################################################
+    phrase_prefilter = QGramFilter(q=3)
+
+    def __init__(self, pdf_path, form_type, org_name=None, tax_period=None, raster_cache=None):
 
 
         self.pdf_file_path = pathlib.Path(pdf_path)
@@ -121,6 +181,9 @@ class NineNinetyForm():
         self.tax_period = str(tax_period)
         self.form_components = {} #A dict for NineNinetyPage objs corresponding to form components
         self.pages = None
+        self.failed_pages = {} #A dict of page index: exception for pages that could not be ocr'ed
+        #Rasterized page images, shared between extract_pages() and load_pages()
+        self.raster_cache = raster_cache if raster_cache else RasterCache()
         ####
         # Need some method here that can tell us if the pdf is already text searchable
         # OCRmyPDF could do this, but that library is really for the command line
@@ -186,7 +249,7 @@ class NineNinetyForm():
     def org_name(self, value):
         self._org_name = value
 
-    def extract_pages(self, save_path=None, save_type=None):
+    def extract_pages(self, save_path=None, save_type=None, workers=None, executor="process"):
         '''OCR's the entire form pdf
 
         Stores the resulting text data within in a list of NineNinetyPage objects.
@@ -195,12 +258,29 @@ class NineNinetyForm():
         Page data can then be requested either through self.pages (set at the end of this function)
         or by loading pre-ocr'ed page data via `self.load_pages()`.
 
+        Pages can be ocr'ed concurrently by setting `workers` to the number of pages to process at
+        once. By default a process pool is used. Since pytesseract runs tesseract in a subprocess,
+        `executor="thread"` is a lighter-weight alternative. Pages are always returned in page
+        index order.
+
+        If a page fails to ocr, the error is stored in `self.failed_pages` (keyed by page index)
+        and the remaining pages are still returned.
+
+        To work with pages as soon as they are ocr'ed, without holding every page in memory, see
+        `self.iter_pages()`.
+
         Goal of this function is to set self.pages = pages
 
         :param save_path: path to a directory
         :type save_path: string
-        :param save_type: file extension, either "csv" or "pickle"
+        :param save_type: file extension, one of "csv", "pickle", "parquet" or "arrow". "csv" and
+            "pickle" save one file per page. "parquet" and "arrow" save every page to a single
+            columnar file that `load_pages()` can read selectively (requires pyarrow)
         :type save_type: string
+        :param workers: number of pages to ocr concurrently. Default None ocr's pages one at a time
+        :type workers: int
+        :param executor: worker pool type, either "process" or "thread". Default "process"
+        :type executor: string
 
         :returns: list of NineNinetyPage objects
         :rtype: list
@@ -215,26 +295,21 @@ class NineNinetyForm():
             validation_utils.validate_extract_pages_save_path(save_path)
             if save_type:
                 validation_utils.validate_extract_pages_save_type(save_type)
+        validation_utils.validate_extract_pages_workers(workers, executor)
 
-        #All NineNinetyPage objects will be appended to this list
-        pages = []
+        self.failed_pages = {}
 
-        #Temp directory used to easily manage memory and storage requirements of loading pdf images
-        with tempfile.TemporaryDirectory() as temp_path:
-
-            #Convert pdf to images stored in temporary directory. Return temporary paths
-            print("Converting pdf to images. Large pdfs will take a while ...")
-            page_image_paths = convert_from_path(self.pdf_file_path, dpi=300, grayscale=True,
-                                                paths_only=True, output_folder=temp_path)
-            print("... Done!")
+        #Pages are rasterized and ocr'ed in a pipeline by iter_pages(). Collect them as they finish
+        print("Converting pdf to images and OCR-ing pdf pages. This may take a while ...")
+        page_count = self.raster_cache.page_count(self.pdf_file_path)
+        pages = list(tqdm(self.iter_pages(workers=workers, executor=executor), total=page_count))
+        #Pages finish out of order. Return them in page index order
+        pages.sort(key=lambda page: page.index)
+        print("... Done!")
 
-            # Iterate each image (page), return instance of NineNinetyPage with data attached
-            print("OCR-ing pdf pages. This may take a while ...")
-            for index,path in enumerate(tqdm(page_image_paths)):
-                page = NineNinetyPage(image_path=path, data_path=None, parent_nineninetyform=self,
-                                        index=index)
-                pages.append(page)
-            print("... Done!")
+        if self.failed_pages:
+            print(f"Warning! {len(self.failed_pages)} page(s) could not be ocr'ed: "
+                    f"{sorted(self.failed_pages)}. See `failed_pages` for errors")
 
 
         ######################################################
@@ -258,6 +333,10 @@ class NineNinetyForm():
                     full_page_save_path = pathlib.PurePath(save_path, 
                                                             f"{time_stamp}_{self.org_name}_{self.form_type}_{self.tax_period}_{page.index}")
                     page.ocr_dataframe.to_pickle(full_page_save_path)
+            elif save_type in OCR_STORE_EXTENSIONS:
+                full_store_save_path = pathlib.PurePath(save_path,
+                                                        f"{time_stamp}_{self.org_name}_{self.form_type}_{self.tax_period}.{OCR_STORE_EXTENSIONS[save_type]}")
+                write_ocr_store(pages, full_store_save_path, save_type)
 
         else:
             print("No save path provided for extracted pages")
@@ -268,10 +347,172 @@ class NineNinetyForm():
         return pages
 
 
-    def load_pages(self, data_path_list, page_index_list):
+    def iter_pages(self, page_index_list=None, workers=None, executor="process", ordered=False):
+        '''Generator that yields NineNinetyPage objects as soon as each page is ocr'ed
+
+        Pages are rasterized in small batches (through `self.raster_cache`) while the worker pool
+        ocr's the batches already submitted, so rasterization and ocr overlap. Unlike
+        `extract_pages()`, yielded pages are not stored on the form. Drop them once you are done
+        with them to keep memory flat. Results can be passed straight into `search_form()` or
+        `extract_component_tables()` through their `pages` argument.
+
+        If a page fails to ocr, it is skipped and the error is stored in `self.failed_pages`
+        (keyed by page index).
+
+        :param page_index_list: page indices (counting from 0) to ocr. Default None ocr's all pages
+        :type page_index_list: list
+        :param workers: number of pages to ocr concurrently. Default None ocr's pages one at a time
+        :type workers: int
+        :param executor: worker pool type, either "process" or "thread". Default "process"
+        :type executor: string
+        :param ordered: True/False value of whether to yield pages in page index order instead of
+        in the order they finish. Default False
+        :type ordered: bool
+
+        :returns: generator of NineNinetyPage objects
+        :rtype: generator
+        '''
+
+        validation_utils.validate_extract_pages_workers(workers, executor)
+
+        if page_index_list is None:
+            page_index_list = range(self.raster_cache.page_count(self.pdf_file_path))
+
+        with NineNinetyForm._ocr_pool(workers, executor) as pool:
+            yield from self._iter_pages(pool, page_index_list, workers or 1, ordered)
+
+    @staticmethod
+    def _ocr_pool(workers=None, executor="process"):
+        '''Starts the worker pool used to ocr pages
+
+        A single worker runs in a thread. Tesseract already runs in its own subprocess, so this is
+        enough to overlap ocr with rasterizing the next batch of pages.
+
+        :returns: concurrent.futures executor
+        :rtype: object
+        '''
+        if not workers or workers == 1:
+            return concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        if executor == "process":
+            return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def _iter_pages(self, pool, page_index_list, batch_size, ordered=False):
+        '''Body of `iter_pages()`, ocr'ing pages on a worker pool that's already running
+
+        Lets several rounds of ocr share one pool. Pages are submitted `batch_size` at a time.
+
+        :returns: generator of NineNinetyPage objects
+        :rtype: generator
+        '''
+        page_index_list = [int(page_index) for page_index in page_index_list]
+
+        #Forget earlier failures of the pages about to be ocr'ed again
+        for index in page_index_list:
+            self.failed_pages.pop(index, None)
+
+        finished_pages = {} #Pages waiting for their turn when ordered=True
+        next_position = 0 #Position in page_index_list of the next page to yield when ordered=True
+        pending = {} #future: (page index, image path)
+
+        try:
+            for batch_start in range(0, len(page_index_list), batch_size):
+
+                #Rasterize the next batch while the pool is busy with the previous one
+                batch = page_index_list[batch_start:batch_start + batch_size]
+                image_paths = self.raster_cache.get_page_paths(self.pdf_file_path, batch, dpi=300)
+                for index, image_path in zip(batch, image_paths):
+                    #Keep the image in the raster cache until its page takes over the pin
+                    raster_cache.pin(image_path)
+                    pending[pool.submit(_ocr_page, index, image_path)] = (index, image_path)
+
+                #Keep at most two batches in flight. Bounds memory on long pdfs
+                while len(pending) > batch_size:
+                    done, _ = concurrent.futures.wait(pending,
+                                return_when=concurrent.futures.FIRST_COMPLETED)
+                    for page in self._collect_ocr_futures(done, pending):
+                        finished_pages[page.index] = page
+
+                    if not ordered:
+                        yield from finished_pages.values()
+                        finished_pages = {}
+                    else:
+                        next_position = yield from self._yield_in_order(
+                                            page_index_list, next_position, finished_pages)
+
+            while pending:
+                done, _ = concurrent.futures.wait(pending,
+                            return_when=concurrent.futures.FIRST_COMPLETED)
+                for page in self._collect_ocr_futures(done, pending):
+                    finished_pages[page.index] = page
+
+                if not ordered:
+                    yield from finished_pages.values()
+                    finished_pages = {}
+                else:
+                    next_position = yield from self._yield_in_order(
+                                        page_index_list, next_position, finished_pages)
+
+        finally:
+            #If the caller stops iterating early, don't ocr pages nobody will look at
+            for future, (_, image_path) in pending.items():
+                future.cancel()
+                raster_cache.unpin(image_path)
+
+    def _collect_ocr_futures(self, done, pending):
+        '''Turns finished `_ocr_page()` futures into NineNinetyPage objects
+
+        Removes the futures from `pending` and releases their image pins. Failed pages are recorded
+        in `self.failed_pages`.
+
+        :returns: list of NineNinetyPage objects
+        :rtype: list
+        '''
+        pages = []
+        for future in done:
+            index, image_path = pending.pop(future)
+            try:
+                _, ocr_dataframe = future.result()
+            except Exception as error:
+                self.failed_pages[index] = error
+                raster_cache.unpin(image_path)
+                continue
+            pages.append(NineNinetyPage(image_path=image_path, data_path=None,
+                                        parent_nineninetyform=self, index=index,
+                                        ocr_dataframe=ocr_dataframe))
+            raster_cache.unpin(image_path) #The page now pins its own image
+        return pages
+
+    def _yield_in_order(self, page_index_list, next_position, finished_pages):
+        '''Yields finished pages that are next in `page_index_list` order
+
+        Pages that failed to ocr are skipped over.
+
+        :returns: position in `page_index_list` of the next page to yield
+        :rtype: int
+        '''
+        while next_position < len(page_index_list):
+            index = page_index_list[next_position]
+            if index in finished_pages:
+                yield finished_pages.pop(index)
+            elif index not in self.failed_pages:
+                break
+            next_position += 1
+
+        return next_position
+
+    def load_pages(self, data_path_list, page_index_list=None, columns=None):
         '''Use a series of pre-ocr'ed data files and corresponding page indices to populate list of
         NineNinetyPage objects.
 
+        `data_path_list` can also be the path to a single ".parquet" or ".arrow" file saved by
+        `extract_pages()`. Then `page_index_list` is optional and selects which pages to load
+        (default None loads every page in the file), and `columns` can limit which ocr dataframe
+        columns are read. Only the selected pages and columns are read from disk.
+        ```
+        form.load_pages("temp_data/1612345678_org_990_2015.arrow", [0, 33, 34])
+        ```
+
         Data files must be derrived from
         `pytesseract.image_to_data(tesseract_image, output_type=pytesseract.Output.DATAFRAME)` and
         saved using pandas' `df.to_csv()` or `df.to_pickle()` dataframe methods. This mirrors the
@@ -285,6 +526,9 @@ class NineNinetyForm():
         For the following inputs `[data_path_0, data_path_1, data_path_2], [0, 33, 34]`,
         `data_path_1` represents page data for the 33rd page (counting from 0) of the pdf.
 
+        Only the pdf pages listed in `page_index_list` are converted to images. Page images are kept in
+        `self.raster_cache`, so pages converted by an earlier call are not converted again.
+
         If page data was originally extracted and saved using `extract_pages()`, the page index
         will be saved into the name of the data path. To quickly extract these indicies from a
         list of pickle paths:
@@ -293,15 +537,25 @@ class NineNinetyForm():
         page_index_list = list(map(lambda x: x.split("_")[-1], data_paths))
         ```
 
-        :param data_path_list: List of paths to ocr data files
-        :type data_path_list: list
+        :param data_path_list: List of paths to ocr data files, or path to a columnar ocr store
+        :type data_path_list: list or string
         :param page_index_list: List of data paths' corresponding pdf page indices
         :type page_index_list: list
+        :param columns: ocr dataframe columns to read from a columnar ocr store. Default None reads all
+        :type columns: list
 
         :returns: list of NineNinetyPage objects
         :rtype: list
         '''
 
+        ############################
+        # A single columnar ocr store. Read the selected pages' data, then only the pages found
+        ############################
+        if isinstance(data_path_list, (str, pathlib.PurePath)):
+            validation_utils.validate_load_pages_store_path(data_path_list)
+            ocr_dataframes = read_ocr_store(data_path_list, page_index_list, columns)
+            return self._load_store_pages(ocr_dataframes)
+
         ############################
         # Validate that the user has provided a data_path_list and a page_index_list of the same
         # length
@@ -316,28 +570,43 @@ class NineNinetyForm():
         #Create pages list. Will be filled with NineNinetyPage objects
         pages = []
 
-        with tempfile.TemporaryDirectory() as temp_path:
-
-            #Convert pdf to images stored in temporary directory. Return temporary paths
-            print("Converting pdf to images. Large pdfs will take a while ...")
-            page_image_paths = convert_from_path(self.pdf_file_path, dpi=300, grayscale=True,
-                                                paths_only=True, output_folder=temp_path)
-            print("... Done!")
+        #Only render the requested pages. Pages already in the raster cache are not rendered again
+        print("Converting pdf pages to images ...")
+        page_image_paths = self.raster_cache.get_page_paths(self.pdf_file_path, page_index_list,
+                                                            dpi=300)
+        print("... Done!")
 
-            print("Loading pdf images and data paths into NineNinetyPage objects ... ")
-            for index, data_path in enumerate(tqdm(data_path_list)):
-                page = NineNinetyPage(image_path=page_image_paths[int(page_index_list[index])],
-                                        data_path=data_path, parent_nineninetyform=self,
-                                        index=page_index_list[index])
-                pages.append(page)
-            print("... Done!")
+        print("Loading pdf images and data paths into NineNinetyPage objects ... ")
+        for index, data_path in enumerate(tqdm(data_path_list)):
+            page = NineNinetyPage(image_path=page_image_paths[index],
+                                    data_path=data_path, parent_nineninetyform=self,
+                                    index=page_index_list[index])
+            pages.append(page)
+        print("... Done!")
 
         self.pages = pages
 
         return pages
 
+    def _load_store_pages(self, ocr_dataframes):
+        '''Populates self.pages from a dict of page index: ocr dataframe read from an ocr store
+        '''
+        page_index_list = list(ocr_dataframes)
+
+        print("Converting pdf pages to images ...")
+        page_image_paths = self.raster_cache.get_page_paths(self.pdf_file_path, page_index_list,
+                                                            dpi=300)
+        print("... Done!")
+
+        self.pages = [NineNinetyPage(image_path=image_path, parent_nineninetyform=self,
+                                        index=page_index, ocr_dataframe=ocr_dataframes[page_index])
+                        for page_index, image_path in zip(page_index_list, page_image_paths)]
 
-    def search_form(self, form_component):
+        return self.pages
+
+
+    def search_form(self, form_component, pages=None, search_mode="full", workers=None,
+        executor="process"):
         '''Searches entire NineNinetyForm for user-identified form component
 
         User can only request form components listed in `NineNinetyForm.valid_form_components`
@@ -346,41 +615,182 @@ class NineNinetyForm():
         `NineNinetyForm.valid_form_components` and `NineNinetyForm.form_component_search_phrases`
         prior to calling this function.
 
+        By default `self.pages` is searched. Any other iterable of NineNinetyPage objects, such as
+        `self.iter_pages()`, can be searched instead by passing it to `pages`.
+
+        With `search_mode="header"` the form's pages don't need to be ocr'ed beforehand. Instead,
+        only the header strip of each page is ocr'ed, at low resolution, to find candidate pages.
+        Only candidates, and the pages that continue on from them, are then fully ocr'ed and
+        searched. This is much faster than `extract_pages()` when only a few pages are needed, but
+        assumes form component headers are printed at the top of upright pages.
+
         Function will return list of pages AND populate self.form_components with key/value pairs
         if matching pages are identified.
 
         :param form_component: irsx-style string name of form component
         :type form_component: string
+        :param pages: iterable of NineNinetyPage objects to search. Default None searches self.pages
+        :type pages: iterable
+        :param search_mode: Either "full" to search fully ocr'ed pages or "header" to locate pages
+        from their header strip first. Default "full"
+        :type search_mode: string
+        :param workers: number of pages to ocr concurrently when `search_mode="header"`
+        :type workers: int
+        :param executor: worker pool type, either "process" or "thread". Default "process"
+        :type executor: string
 
         :returns: List of NineNinetyPage object determined to be part of requested form component
         :rtype: list
         '''
 
-        #Create list to store identified form component pages
-        pages = []
+        validation_utils.validate_search_mode(search_mode, pages)
+
+        if search_mode == "header":
+            component_pages = self._search_headers(form_component, workers, executor)
+
+        else:
+            if pages is None:
+                # Confirm NineNinetyForm object has already processed pages.
+                # Required for search_form() function
+                validation_utils.validate_page_attribute(self)
+                pages = self.pages
+
+            #Create list to store identified form component pages
+            component_pages = list(self._search_pages(form_component, pages))
+
+        self.form_components[form_component] = component_pages
+
+        return component_pages
+
+    def index_components(self, pages=None, max_l_dist=4):
+        '''Searches NineNinetyForm for every supported form component at once
+
+        All search phrases of the form type's components in `NineNinetyForm.valid_form_components`
+        are compiled into a single `PhraseIndex`. Each page's text is then lowercased and scanned
+        once for all components, instead of once per component with `search_form()`. Matches are
+        the same as calling `search_form()` for each component.
+
+        Populates self.form_components with a key/value pair for every supported form component,
+        including components with no matching pages.
+
+        :param pages: iterable of NineNinetyPage objects to search. Default None searches self.pages
+        :type pages: iterable
+        :param max_l_dist: maximum levenshtein distance for phrase matching, default 4
+        :type max_l_dist: integer
+
+        :returns: dict of form component: list of NineNinetyPage objects
+        :rtype: dict
+        '''
+
+        if pages is None:
+            # Confirm NineNinetyForm object has already processed pages.
+            validation_utils.validate_page_attribute(self)
+            pages = self.pages
+
+        component_search_phrases = {
+            form_component: search_phrases
+            for form_component, search_phrases
+            in NineNinetyForm.form_component_search_phrases[self.form_type].items()
+            if form_component in NineNinetyForm.valid_form_components[self.form_type]
+        }
+        phrase_index = PhraseIndex(component_search_phrases, max_l_dist=max_l_dist)
+
+        component_pages = {form_component: [] for form_component in component_search_phrases}
+        for page in pages:
+            for form_component in phrase_index.search(page.ocr_dataframe_to_text()):
+                component_pages[form_component].append(page)
+
+        self.form_components.update(component_pages)
+
+        return component_pages
+
+    def _search_headers(self, form_component, workers=None, executor="process"):
+        '''Finds form component pages by ocr'ing low resolution page header strips first
+
+        Called by `search_form(search_mode="header")`. Pages whose header strip matches the form
+        component's search phrases, or whose header strip could not be ocr'ed, are fully ocr'ed and
+        searched as usual. Each matching page is followed by its continuation pages, ocr'ed one
+        at a time, until a page no longer matches.
+
+        :returns: List of NineNinetyPage object determined to be part of requested form component
+        :rtype: list
+        '''
+        validation_utils.validate_form_component(form_component,
+                                                NineNinetyForm.valid_form_components[self.form_type].keys())
+        validation_utils.validate_extract_pages_workers(workers, executor)
+
+        search_phrases = NineNinetyForm.form_component_search_phrases[self.form_type][form_component]
+
+        #####################################
+        # First, ocr every page's header strip at low resolution and collect candidate pages
+        #####################################
+        print("Converting pdf to low resolution images ...")
+        header_image_paths = self.raster_cache.get_page_paths(self.pdf_file_path,
+                                                            dpi=NineNinetyForm.header_search_dpi)
+        print("... Done!")
+
+        #One worker pool ocr's the header strips, the candidate pages and their continuation pages
+        with NineNinetyForm._ocr_pool(workers, executor) as pool:
+            print("Searching page headers ...")
+            candidate_indices = []
+            futures = {pool.submit(_ocr_page_header, index, path,
+                                    NineNinetyForm.header_search_fraction): index
+                        for index, path in enumerate(header_image_paths)}
+            for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
+                try:
+                    index, header_text = future.result()
+                except Exception: #Can't rule the page out. Let the full ocr pass decide
+                    candidate_indices.append(futures[future])
+                    continue
+                if NineNinetyForm.phrase_match(search_phrases, header_text):
+                    candidate_indices.append(index)
+            print("... Done!")
+
+            #####################################
+            # Next, fully ocr the candidates, then follow each match onto its continuation pages
+            #####################################
+            print(f"OCR-ing {len(candidate_indices)} candidate page(s) ...")
+            component_pages = {page.index: page for page in self._search_pages(form_component,
+                                    self._iter_pages(pool, sorted(candidate_indices), workers or 1))}
+
+            for index in sorted(component_pages):
+                next_index = index + 1
+                while next_index < len(header_image_paths) and next_index not in component_pages:
+                    next_pages = list(self._search_pages(form_component,
+                                                        self._iter_pages(pool, [next_index], 1)))
+                    if not next_pages:
+                        break
+                    component_pages[next_index] = next_pages[0]
+                    next_index += 1
+            print("... Done!")
+
+        return [component_pages[index] for index in sorted(component_pages)]
+
+    def _search_pages(self, form_component, pages):
+        '''Lazily filters an iterable of NineNinetyPage objects down to a form component's pages
+
+        The form component is validated right away. Pages are only searched as the returned
+        generator is consumed, so pages can be searched while later pages are still being ocr'ed.
+
+        :returns: generator of NineNinetyPage objects matching the form component
+        :rtype: generator
+        '''
 
         # Validate that submitted form component is handlable
         validation_utils.validate_form_component(form_component, 
                                                 NineNinetyForm.valid_form_components[self.form_type].keys())
-        # Confirm NineNinetyForm object has already processed pages.
-        # Required for search_form() function
-        validation_utils.validate_page_attribute(self)
 
         #Grab search phrases
         search_phrases = NineNinetyForm.form_component_search_phrases[self.form_type][form_component]
-        #Iterate through NineNinetyForm instances pages, search for matches
-        for page in self.pages:
-            page_text = page.ocr_dataframe_to_text() #Turn ocr data into single string of page text
-            is_phrase_detected = NineNinetyForm.phrase_match(search_phrases, page_text)
-            if is_phrase_detected:
-                pages.append(page)
-
-        self.form_components[form_component] = pages
-
-        return pages
+        #Iterate through pages, search for matches. Page text is the ocr data as a single string
+        return (page for page in pages
+                if NineNinetyForm.phrase_match(search_phrases, page.ocr_dataframe_to_text(),
+                    page_qgrams=page.ocr_text_qgrams(NineNinetyForm.phrase_prefilter)))
 
     def extract_component_tables(self, form_component, merge=False, use_cascadetabnet=False, 
-        table_type="bordered", extraction_method="custom"):
+        table_type="bordered", extraction_method="custom", pages=None, search_mode="full",
+        workers=None, bordered_method="oi", executor="process", correct_orientation=True,
+        tds_batched_ocr=False):
         '''Extracts tabular data for a specific form component
 
         Combines `search_form()` (if not previously requested) and
@@ -393,19 +803,43 @@ class NineNinetyForm():
         pages. It's also possible that `search_form()` did not identify any pages for that form
         component.
 
+        If an iterable of NineNinetyPage objects is passed to `pages`, such as `self.iter_pages()`,
+        it is searched page by page and tables are extracted from each matching page as soon as
+        it arrives. The matching pages are stored in `self.form_components`.
+
         :param form_component: irsx-style string name of form component
         :type form_component: string
         :param merge: True/False value of whether to ask ocirs to attempt to combine extracted
         tables into one. Default is False
         :type merge: bool
         :param use_cascadetabnet: True/False value of whether to use CascadeTabNet table detection
-        model. Requires CUDA-enabled GPU
+        model. Tables on the component pages are detected in batches
         :type use_cascadetabnet: bool
         :param table_type: What type of tables will ocris be processing. Either "bordered" or
         "borderless". "detect" is also available when `use_cascadetabnet=True`
         :type table_type: string
         :param extraction_method: Table extraction method to use. "custom" is only current option.
         :type extraction_method: string
+        :param pages: iterable of NineNinetyPage objects to search and extract from. Default None
+        uses the pages found by `search_form()`
+        :type pages: iterable
+        :param search_mode: `search_mode` passed to `search_form()` if it has not been called yet.
+        Default "full"
+        :type search_mode: string
+        :param workers: number of pages to ocr concurrently when `search_mode="header"`
+        :type workers: int
+        :param bordered_method: Bordered table extractor passed to `extract_tables()`. Either "oi"
+        (default) or "tds"
+        :type bordered_method: string
+        :param executor: worker pool type used when `search_mode="header"`, either "process" or
+        "thread". Default "process"
+        :type executor: string
+        :param correct_orientation: True/False value of whether to rotate pages right-way up before
+        extracting tables, passed to `extract_tables()`. Default True
+        :type correct_orientation: bool
+        :param tds_batched_ocr: True/False value of whether `bordered_method="tds"` ocr's the cells
+        of tables cropped by CascadeTabNet in batches, passed to `extract_tables()`. Default False
+        :type tds_batched_ocr: bool
 
         :returns: List of NineNinetyPage object determined to be part of requested form component
         :rtype: list
@@ -414,46 +848,76 @@ class NineNinetyForm():
         #####################################
         # First, check whether NineNinetyForm instance has pages for requested form component
         #####################################
-        if form_component not in self.form_components: #search_form() has not been called. Do now
-            component_pages = self.search_form(form_component)
+        if pages is not None: #Search the stream of pages lazily, extracting tables as pages match
+            component_pages = self._search_pages(form_component, pages)
+        elif form_component not in self.form_components: #search_form() has not been called. Do now
+            component_pages = self.search_form(form_component, search_mode=search_mode,
+                                                workers=workers, executor=executor)
         else:
             component_pages = self.form_components[form_component]
 
-        #Warn users that there are no pages to extract tables from
-        if not component_pages:
-            print("Warning! No component pages found. No tables to extract")
-
         ###################################
         # Next, iterate through component page list and extract tables
         #####################################
         component_table_dataframes = []
+        extracted_pages = []
         print(f"Extracting tables from {form_component} pages. This may take a while ...")
-        for page in tqdm(component_pages):
-            #Pull dataframe list from page
-            dataframe_list = page.extract_tables(use_cascadetabnet=use_cascadetabnet,
-                                                table_type=table_type,
-                                                extraction_method=extraction_method)
-            component_table_dataframes = component_table_dataframes + dataframe_list
+        if use_cascadetabnet and pages is None:
+            #Every component page is already known. Detect tables on them in batches
+            extracted_pages = list(component_pages)
+            for dataframe_list in NineNinetyPage.extract_tables_batch(extracted_pages,
+                                                                    use_cascadetabnet=use_cascadetabnet,
+                                                                    table_type=table_type,
+                                                                    extraction_method=extraction_method,
+                                                                    bordered_method=bordered_method,
+                                                                    correct_orientation=correct_orientation,
+                                                                    tds_batched_ocr=tds_batched_ocr):
+                component_table_dataframes = component_table_dataframes + dataframe_list
+        else:
+            for page in tqdm(component_pages):
+                #Pull dataframe list from page
+                dataframe_list = page.extract_tables(use_cascadetabnet=use_cascadetabnet,
+                                                    table_type=table_type,
+                                                    extraction_method=extraction_method,
+                                                    bordered_method=bordered_method,
+                                                    correct_orientation=correct_orientation,
+                                                    tds_batched_ocr=tds_batched_ocr)
+                component_table_dataframes = component_table_dataframes + dataframe_list
+                extracted_pages.append(page)
         print("... Done!")
 
+        if pages is not None:
+            self.form_components[form_component] = extracted_pages
+
+        #Warn users that there are no pages to extract tables from
+        if not extracted_pages:
+            print("Warning! No component pages found. No tables to extract")
+
         if merge:
             component_table_dataframes = [merge_dataframes(component_table_dataframes)] #Brackes around output to maintain list of df output
 
         return component_table_dataframes
 
     @staticmethod
-    def phrase_match(phrase_list, page_text, max_l_dist=4):
+    def phrase_match(phrase_list, page_text, max_l_dist=4, page_qgrams=None):
         '''Fuzzysearches `page_text` for phrases pased in `phrase_list`.
 
         String matching performed using the [fuzzysearch](https://github.com/taleinat/fuzzysearch)
         Python package.
 
+        Before each fuzzysearch, `NineNinetyForm.phrase_prefilter` checks whether the page shares
+        enough q-grams with the phrase to possibly match. Phrases that can't match are skipped.
+        The result is always the same as fuzzysearching every phrase.
+
         :param phrase_list: phrase list corresponding to certain form component
         :type phrase_list: list
         :param page_text: page text
         :type page_text: string
         :param max_l_dist: maximum levenshtein distance for fuzzysearch, default 4
         :type max_l_dist: integer
+        :param page_qgrams: precomputed q-gram set of `page_text`, e.g. from
+        `NineNinetyPage.ocr_text_qgrams()`. Computed from `page_text` if not provided
+        :type page_qgrams: numpy array
 
         :returns: bool depending if a phrase was matched within certain levenshtein distance
         :rtype: bool
@@ -461,11 +925,18 @@ class NineNinetyForm():
 
         detected_phrase = False
 
+        if page_qgrams is None:
+            page_qgrams = NineNinetyForm.phrase_prefilter.text_qgrams(page_text)
+
         ######################################################
         #Iterate through the phrase list and detect matches
         #####################################################
         ##### Fuzzysearch: https://github.com/taleinat/fuzzysearch
         for phrase in phrase_list:
+            #Skip the fuzzysearch if the page can't contain the phrase
+            if not NineNinetyForm.phrase_prefilter.could_match(phrase, page_qgrams, max_l_dist):
+                continue
+
             #Search page text for a phrase within 2 character changes (levenstein distance)
             if len(fuzzysearch.find_near_matches(phrase.lower(), page_text.lower(),
                                                 max_l_dist=max_l_dist)
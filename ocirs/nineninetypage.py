@@ -1,7 +1,11 @@
+import os
 import pathlib
+import weakref
 
-from ocirs.table_extraction.table_extraction import extract_tables
-from ocirs.image_utils import ocr_preprocess
+from ocirs.table_extraction.table_extraction import extract_tables, extract_tables_batch, CASCADETABNET_BATCH_SIZE
+from ocirs.image_utils import ocr_preprocess, detect_orientation
+from ocirs import ocr_cache
+from ocirs import raster_cache
 from ocirs.validation_utils import validate_extract_tables_settings
 
 
@@ -11,29 +15,50 @@ import pytesseract
 PYTESSERACT_CUSTOM_CONFIG = "--oem 3 --psm 1"
 
 import cv2
+import numpy as np
 import pandas as pd
 
 class NineNinetyPage():
     '''A class for processing scanned IRS form 990 pages
 
-    Each form page is self contained, consisting of an image of the page (loaded using cv2 on
-    initialization) and a dataframe of ocr data (created on initialization). A page may be linked
+    Each form page is self contained, consisting of an image of the page (loaded using cv2 when it
+    is first needed) and a dataframe of ocr data (created on initialization). A page may be linked
     to a parent form 990 and may be given a page index.
 
+    Page images are large, so by default the page only holds a weak reference to its loaded image
+    (`image_cache="weak"`). The image is reloaded from `image_path` whenever it is needed again
+    after being freed. `image_cache="strong"` keeps the loaded image for the page's lifetime.
+    `image_cache="mmap"` saves the decoded image next to `image_path` as a .npy file and memory
+    maps it, so reloads skip image decoding and pages share the operating system's file cache.
+    Since the image must stay reloadable, `image_path` is pinned in the raster cache (see
+    `ocirs.raster_cache.pin()`) for as long as the page is alive.
+
     If loading a data path, data files must be derrived from
     `pytesseract.image_to_data(tesseract_image, output_type=pytesseract.Output.DATAFRAME)` and
     saved using pandas' `df.to_csv()` or `df.to_pickle()` dataframe methods. This mirrors the
     process used in `ocr()`.
+
+    An already computed ocr dataframe can also be handed over directly with `ocr_dataframe`, in
+    which case the page is not ocr'ed again.
     '''
 
-    def __init__(self, image_path, data_path=None, parent_nineninetyform=None, index=None):
+    def __init__(self, image_path, data_path=None, parent_nineninetyform=None, index=None,
+        ocr_dataframe=None, image_cache="weak"):
 
+        self._image_path_pin = None #Keeps image_path from raster cache eviction. See `image_path`
         self.image_path = pathlib.Path(image_path)
-        self.image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        self.image_cache = image_cache
+        self._image = None #Strong reference to the page image. See `image` property
+        self._image_ref = None #Weak reference to the page image. See `image` property
+        self._page_text = None #Cached page text. See `ocr_dataframe_to_text()`
+        self._orientation = None #Cached page orientation. See `orientation` property
         self.data_path = data_path
         self.parent_nineninetyform = parent_nineninetyform
         self.index = int(index) if index else index #Converts input to int, else keeps as Nonetype
-        self.ocr_dataframe = self.ocr() if image_path and not data_path else self.load_ocr_dataframe()
+        if ocr_dataframe is not None:
+            self.ocr_dataframe = ocr_dataframe
+        else:
+            self.ocr_dataframe = self.ocr() if image_path and not data_path else self.load_ocr_dataframe()
         self.tables = None
 
     @property
@@ -46,8 +71,84 @@ class NineNinetyPage():
         if not value.is_file():
             raise FileNotFoundError(f"Image file does not exist at {value}")
 
+        #Pin the new image so it stays on disk while the page is alive, and release the old one
+        if self._image_path_pin is not None:
+            self._image_path_pin()
+        self._image_path_pin = raster_cache.pin(value, owner=self)
         self._image_path = value
 
+    @property
+    def image_cache(self):
+        '''Getter for self.image_cache
+        '''
+        return self._image_cache
+    @image_cache.setter
+    def image_cache(self, value):
+        if value not in ("weak", "strong", "mmap"):
+            raise ValueError(f"""image_cache must be set to one of 'weak', 'strong' or 'mmap'.
+                            Recieved '{value}'""")
+
+        self._image_cache = value
+
+    @property
+    def image(self):
+        '''Getter for self.image
+
+        Grayscale numpy array of the page image. Loaded from `image_path` on first use and cached
+        according to `image_cache`.
+        '''
+        if self._image is not None:
+            return self._image
+
+        image = self._image_ref() if self._image_ref is not None else None
+        if image is None:
+            image = self.load_image()
+            if self.image_cache == "strong":
+                self._image = image
+            else:
+                self._image_ref = weakref.ref(image)
+
+        return image
+    @image.setter
+    def image(self, value):
+        #An image set by hand can't be reloaded from image_path, so always keep it
+        self._image = value
+        self._image_ref = None
+        self._orientation = None
+
+    @property
+    def orientation(self):
+        '''Getter for self.orientation
+
+        Degrees the page image must be rotated to be right-way up, as found by tesseract's
+        orientation detection. Detected once, on first use, and handed to table extraction by
+        `extract_tables()` so orientation isn't detected again for every table.
+        '''
+        if self._orientation is None:
+            self._orientation = detect_orientation(self.image)
+
+        return self._orientation
+    @orientation.setter
+    def orientation(self, value):
+        if not isinstance(value, int) or value % 90 != 0:
+            raise ValueError(f"orientation must be a multiple of 90 degrees. Recieved {value}")
+
+        self._orientation = value
+
+    @property
+    def ocr_dataframe(self):
+        '''Getter for self.ocr_dataframe
+        '''
+        return self._ocr_dataframe
+    @ocr_dataframe.setter
+    def ocr_dataframe(self, value):
+        #New ocr data means the cached page text no longer applies
+        self._ocr_dataframe = value
+        self._page_text = None
+        self._word_offsets = None
+        self._word_labels = None
+        self._text_qgrams = {} #Cached q-gram sets of the page text, keyed by q
+
     @property
     def data_path(self):
         '''Getter for self.data_path
@@ -123,11 +224,58 @@ class NineNinetyPage():
 
 
 
+    def __getstate__(self):
+        #Weak references and pins can't be pickled. Drop them, the image is reloaded from image_path
+        state = self.__dict__.copy()
+        state["_image_ref"] = None
+        state["_image_path_pin"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._image_path_pin = raster_cache.pin(self._image_path, owner=self)
+
+    def load_image(self):
+        '''Load the page image from `image_path` as a grayscale numpy array
+
+        Method called automatically when `image` is requested. Don't call this on your own.
+
+        :returns: grayscale page image
+        :rtype: numpy array
+        '''
+        if self.image_cache != "mmap":
+            return self._read_image()
+
+        #########################################
+        # Decode the image once into an uncompressed .npy file, then memory map that file
+        #########################################
+        npy_path = self.image_path.with_name(self.image_path.name + ".npy")
+        if not npy_path.is_file():
+            image = self._read_image()
+            #Write under a temporary name first so other pages never map a half written file
+            temp_npy_path = npy_path.with_name(f"{npy_path.name}.{os.getpid()}.tmp")
+            with open(temp_npy_path, "wb") as npy_file:
+                np.save(npy_file, image)
+            os.replace(temp_npy_path, npy_path)
+
+        return np.load(npy_path, mmap_mode="r")
+
+    def _read_image(self):
+        '''Decodes the page image at `image_path` as a grayscale numpy array
+        '''
+        image = cv2.imread(str(self.image_path), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise FileNotFoundError(f"""Could not read page image at {self.image_path}. The file
+                                    was deleted or is not a readable image""")
+
+        return image
+
     def ocr(self):
 
         '''Use pytesseract to extract ocr data from image
 
-        Data extracted as `pytesseract.Output.DATAFRAME`.
+        Data extracted as `pytesseract.Output.DATAFRAME`. Results are cached on disk by image
+        content and tesseract config, see `ocirs.ocr_cache`.
 
         Method called automatically on class object initialization. Don't call this on your own.
 
@@ -140,9 +288,9 @@ class NineNinetyPage():
         tesseract_image = ocr_preprocess(self.image)
 
         ########################################
-        # OCR image using pytesseract
+        # OCR image using pytesseract. Images ocr'ed before are read back from the ocr cache
         ########################################
-        ocr_dataframe = pytesseract.image_to_data(
+        ocr_dataframe = ocr_cache.image_to_data(
             tesseract_image,
             output_type=pytesseract.Output.DATAFRAME,
             config=PYTESSERACT_CUSTOM_CONFIG
@@ -172,34 +320,104 @@ class NineNinetyPage():
 
         Useful for performing text search on page.
 
+        The text is built once and cached on the page until `ocr_dataframe` is replaced. Character
+        offsets into the text can be traced back to ocr_dataframe rows with `text_span_to_rows()`.
+
+        :returns: ocr'ed text as string
+        :rtype: string
+        '''
+        if self._page_text is None:
+            self._page_text, self._word_offsets, self._word_labels = \
+                NineNinetyPage._build_page_text(self.ocr_dataframe)
+
+        return self._page_text
+
+    def ocr_text_qgrams(self, qgram_filter):
+        '''Returns the q-gram set of the page text, for use with `qgram_filter.could_match()`
+
+        Cached on the page until `ocr_dataframe` is replaced.
+
+        :param qgram_filter: QGramFilter used to compute the q-grams
+        :type qgram_filter: QGramFilter
+
+        :returns: sorted numpy array of unique packed q-grams
+        :rtype: numpy array
+        '''
+        if qgram_filter.q not in self._text_qgrams:
+            self._text_qgrams[qgram_filter.q] = qgram_filter.text_qgrams(self.ocr_dataframe_to_text())
+
+        return self._text_qgrams[qgram_filter.q]
+
+    def text_span_to_rows(self, start, end):
+        '''Returns the ocr_dataframe rows of the words covering a span of the page text
+
+        Spans are character offsets into `ocr_dataframe_to_text()`, such as the `start` and `end`
+        of a fuzzysearch match. The returned rows carry each word's bounding box.
+
+        :param start: offset of the first character in the span
+        :type start: int
+        :param end: offset one past the last character in the span
+        :type end: int
+
+        :returns: ocr_dataframe rows of the words in the span
+        :rtype: dataframe
+        '''
+        self.ocr_dataframe_to_text() #Make sure the offsets are built
+
+        first_word = max(np.searchsorted(self._word_offsets, start, side="right") - 1, 0)
+        last_word = np.searchsorted(self._word_offsets, end, side="left")
+
+        return self.ocr_dataframe.loc[self._word_labels[first_word:last_word]]
+
+    @staticmethod
+    def dataframe_to_text(ocr_dataframe):
+        '''Converts any pytesseract.Output.DATAFRAME of ocr data to single text string
+
+        :param ocr_dataframe: pytesseract.Output.DATAFRAME of ocr data
+        :type ocr_dataframe: dataframe
+
         :returns: ocr'ed text as string
         :rtype: string
         '''
+        return NineNinetyPage._build_page_text(ocr_dataframe)[0]
+
+    @staticmethod
+    def _build_page_text(ocr_dataframe):
+        '''Stitches ocr data into page text, keeping track of where each word starts
+
+        :returns: tuple of the page text, the offset of each word in the page text and the
+        ocr_dataframe index label of each word
+        :rtype: tuple
+        '''
         ###############################
         #First, remove text with confidence level of -1
         #############################
-        trunc_dataframe = self.ocr_dataframe[~(self.ocr_dataframe["conf"]==-1)]
+        trunc_dataframe = ocr_dataframe[~(ocr_dataframe["conf"]==-1)]
+
+        #Blank pages have no words. Their empty text column isn't a string column
+        if trunc_dataframe.empty:
+            return "", np.empty(0, dtype=np.int64), trunc_dataframe.index.to_numpy()
 
         ###############################
-        # Next, iterate through text values of dataframe and stitch together full page text
+        # Next, stitch together full page text. Every word is followed by a space, unless the word
+        # is just empty space itself
         ###############################
-        page_text = ""
-        for value in trunc_dataframe['text']:
-            value = str(value)
+        values = trunc_dataframe["text"].map(str)
+        pieces = values.where(values.str.isspace(), values + " ")
+        page_text = "".join(pieces)
 
-            if value.isspace(): #Check if text is just empty space
-                #If it is, simply append value to end of page_text string
-                page_text = page_text + value
-            else:
-                page_text = page_text + value + " "
+        piece_lengths = pieces.str.len().to_numpy()
+        word_offsets = np.cumsum(piece_lengths) - piece_lengths
 
-        # Strip leading and trailing spaces from page text
-        page_text = page_text.strip()
+        # Strip leading and trailing spaces from page text, shifting offsets to match
+        stripped_page_text = page_text.strip()
+        word_offsets = word_offsets - (len(page_text) - len(page_text.lstrip()))
 
-        return page_text
+        return stripped_page_text, word_offsets, trunc_dataframe.index.to_numpy()
 
     def extract_tables(self, use_cascadetabnet=False, table_type="bordered",
-        extraction_method='custom'):
+        extraction_method='custom', bordered_method="oi", correct_orientation=True,
+        tds_batched_ocr=False):
         '''Extract tabular data from NineNinetyPage object
 
         Returns list of dataframes, each representing a table detected on the page. Also sets
@@ -212,12 +430,22 @@ class NineNinetyPage():
         setting inputs.
 
         *use_cascadetabnet: a True/False flag indicating whether the user wants to detect a table
-        and table_type using CasecadeTabNet (currently requires a CUDA-enabled gpu)
+        and table_type using CasecadeTabNet (runs on a CUDA-enabled gpu if available, otherwise on
+        the cpu. Set the OCIRS_CASCADETABNET_DEVICE environment variable to choose a device)
         *table_type: None, "bordered" or "borderless" indicates what type of table is contained in
         the NineNinetyPage object. If set to "bordered" or "borderless" the process will assume all
         tables on the page are of that type.
         *extraction_method: Indicates how to extracttabular data. "custom" table extraction process
         derived from open-intelligence, CascadeTabNet and Towards Data Science.
+        *bordered_method: "oi" or "tds", which "custom" process extracts bordered tables. "oi"
+        (open-intelligence) places words between the table's ruling lines, "tds" (Towards Data
+        Science) fills the cells enclosed by the ruling lines with the words inside them.
+        *correct_orientation: a True/False flag indicating whether to rotate the page right-way up
+        before extraction. The page's orientation is detected once and cached (see `orientation`),
+        and upright pages aren't rotated. Set to False to use pages as they are and skip detection.
+        *tds_batched_ocr: a True/False flag indicating whether "tds" ocr's the cells of tables
+        cropped by CascadeTabNet (which have no ocr data) in a few batched tesseract calls rather
+        than one call per cell. Faster, but off by default since text can differ from per cell ocr.
 
         If use_cascadetabnet = True and table_type=None, then the type of table will be
         automatically detected by CascadeTabnet and applied.
@@ -226,13 +454,21 @@ class NineNinetyPage():
         This method passes these setting variable directly to the table_extraction function.
 
         :param use_cascadetabnet: True/False value of whether to use CascadeTabNet table detection
-        model. Requires CUDA-enabled GPU
+        model
         :type use_cascadetabnet: bool
         :param table_type: What type of tables will ocris be processing. Either "bordered" or
         "borderless". "detect" is also available when `use_cascadetabnet=True`
         :type table_type: string
         :param extraction_method: Table extraction method to use. "custom" is only current option.
         :type extraction_method: string
+        :param bordered_method: Bordered table extractor to use. Either "oi" (default) or "tds"
+        :type bordered_method: string
+        :param correct_orientation: True/False value of whether to rotate the page right-way up
+        first. Default True
+        :type correct_orientation: bool
+        :param tds_batched_ocr: True/False value of whether `bordered_method="tds"` ocr's cropped
+        tables' cells in batches. Default False
+        :type tds_batched_ocr: bool
 
         :returns: list of dataframes containing tabular data found in NineNinetyPage object image
         :rtype: list
@@ -246,14 +482,75 @@ class NineNinetyPage():
         ############################
         # Validate extract table settings
         ############################
-        validate_extract_tables_settings(use_cascadetabnet, table_type, extraction_method)
+        validate_extract_tables_settings(use_cascadetabnet, table_type, extraction_method,
+                                            bordered_method, correct_orientation, tds_batched_ocr)
 
         ##############################
-        # Extract tables
+        # Extract tables. Orientation 0 leaves the page as it is, so upright pages aren't rotated
         #############################
         result = extract_tables(self.image, self.ocr_dataframe, use_cascadetabnet, table_type,
-                                extraction_method)
+                                extraction_method,
+                                orientation=self.orientation if correct_orientation else 0,
+                                bordered_method=bordered_method, tds_batched_ocr=tds_batched_ocr)
 
         self.tables = result
 
         return result
+
+    @staticmethod
+    def extract_tables_batch(pages, use_cascadetabnet=False, table_type="bordered",
+        extraction_method='custom', bordered_method="oi", correct_orientation=True,
+        tds_batched_ocr=False):
+        '''Extract tabular data from several NineNinetyPage objects at once
+
+        Same as calling `extract_tables()` on each page, but with `use_cascadetabnet=True` tables
+        are detected on several pages per CascadeTabNet inference call. Sets each page's
+        `self.tables`.
+
+        Pages are processed `CASCADETABNET_BATCH_SIZE` at a time. Each batch's page images are
+        loaded only when the batch is reached, and released before the next batch is loaded.
+
+        :param pages: list of NineNinetyPage objects
+        :type pages: list
+        :param use_cascadetabnet: True/False value of whether to use CascadeTabNet table detection
+        model
+        :type use_cascadetabnet: bool
+        :param table_type: What type of tables will ocris be processing. Either "bordered" or
+        "borderless". "detect" is also available when `use_cascadetabnet=True`
+        :type table_type: string
+        :param extraction_method: Table extraction method to use. "custom" is only current option.
+        :type extraction_method: string
+        :param bordered_method: Bordered table extractor to use. Either "oi" (default) or "tds"
+        :type bordered_method: string
+        :param correct_orientation: True/False value of whether to rotate each page right-way up
+        first. Default True
+        :type correct_orientation: bool
+        :param tds_batched_ocr: True/False value of whether `bordered_method="tds"` ocr's cropped
+        tables' cells in batches. Default False
+        :type tds_batched_ocr: bool
+
+        :returns: list with one list of dataframes per page
+        :rtype: list
+        '''
+        if extraction_method != "custom":
+            raise ValueError(f'extraction_method must be "custom". Recieved "{extraction_method}"')
+
+        validate_extract_tables_settings(use_cascadetabnet, table_type, extraction_method,
+                                            bordered_method, correct_orientation, tds_batched_ocr)
+
+        results = []
+        for batch_start in range(0, len(pages), CASCADETABNET_BATCH_SIZE):
+            batch_pages = pages[batch_start:batch_start + CASCADETABNET_BATCH_SIZE]
+            batch_results = extract_tables_batch([page.image for page in batch_pages],
+                                                [page.ocr_dataframe for page in batch_pages],
+                                                use_cascadetabnet, table_type, extraction_method,
+                                                orientations=[page.orientation if correct_orientation
+                                                                else 0 for page in batch_pages],
+                                                bordered_method=bordered_method,
+                                                tds_batched_ocr=tds_batched_ocr)
+
+            for page, result in zip(batch_pages, batch_results):
+                page.tables = result
+            results += batch_results
+
+        return results
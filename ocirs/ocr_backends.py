@@ -0,0 +1,250 @@
+import contextlib
+import io
+import os
+import re
+import shlex
+import threading
+from csv import QUOTE_NONE
+
+import numpy as np
+import pandas as pd
+import pytesseract
+
+
+#Header line of tesseract's tsv output. The tesseract api returns the tsv rows without it
+TSV_HEADER = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext"
+
+
+class PytesseractBackend():
+    '''Runs ocr through pytesseract, which starts a `tesseract` process for every call
+
+    The default ocr backend. Needs nothing beyond the `tesseract-ocr` install ocirs always needs.
+    '''
+
+    name = "pytesseract"
+
+    def image_to_data(self, image, config="", output_type=pytesseract.Output.DATAFRAME):
+        '''Same as `pytesseract.image_to_data()`
+        '''
+        return pytesseract.image_to_data(image, output_type=output_type, config=config)
+
+    def image_to_string(self, image, config=""):
+        '''Same as `pytesseract.image_to_string()`
+        '''
+        return pytesseract.image_to_string(image, config=config)
+
+    def detect_orientation(self, image):
+        '''Uses tesseract's orientation and script detection to find how far an image is rotated
+
+        :returns: degrees the image must be rotated clockwise to be right-way up, tesseract's
+            "Rotate:" field
+        :rtype: int
+        '''
+        # Angle solution from
+        # https://stackoverflow.com/questions/55119504/is-it-possible-to-check-orientation-of-an-image-before-passing-it-through-pytess
+        return int(re.search(r'(?<=Rotate: )\d+', pytesseract.image_to_osd(image)).group(0))
+
+    def version(self):
+        '''Returns the tesseract version, used to key the ocr cache
+        '''
+        return str(pytesseract.get_tesseract_version())
+
+
+class TesserocrBackend():
+    '''Runs ocr in process through tesserocr, the Python binding of the tesseract C++ api
+
+    Every thread keeps its own tesseract api with the language model loaded, so no process is
+    started and no model is reloaded per call. Images are handed to tesseract straight from their
+    numpy arrays, without temporary files. Output is parsed exactly as pytesseract parses the
+    `tesseract` command line's output, so both backends return the same data.
+
+    tesserocr is an optional dependency: `pip install tesserocr`. Supported config options are
+    `--psm`, `--oem`, `-l` and `-c name=value`.
+
+    :param tessdata_path: tessdata directory. Default None uses tesseract's own default
+    :type tessdata_path: string
+    :param lang: default language(s), as for `tesseract -l`. Default "eng"
+    :type lang: string
+    '''
+
+    name = "tesserocr"
+
+    def __init__(self, tessdata_path=None, lang="eng"):
+        self._tesserocr = _import_tesserocr()
+        self.tessdata_path = tessdata_path
+        self.lang = lang
+        self._local = threading.local()
+
+    def __getstate__(self):
+        #Tesseract apis can't be pickled. Workers that unpickle the backend start their own
+        state = self.__dict__.copy()
+        del state["_tesserocr"], state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._tesserocr = _import_tesserocr()
+        self._local = threading.local()
+
+    def image_to_data(self, image, config="", output_type=pytesseract.Output.DATAFRAME):
+        '''Same as `pytesseract.image_to_data()`, run in process
+        '''
+        with self._recognize(image, config) as api:
+            tsv = f"{TSV_HEADER}\n{api.GetTSVText(0)}"
+
+        if output_type == pytesseract.Output.DATAFRAME:
+            return pd.read_csv(io.BytesIO(tsv.encode("utf-8")), quoting=QUOTE_NONE, sep="\t")
+        if output_type == pytesseract.Output.DICT:
+            return pytesseract.pytesseract.file_to_dict(tsv, "\t", -1)
+        if output_type == pytesseract.Output.BYTES:
+            return tsv.encode("utf-8")
+        return tsv
+
+    def image_to_string(self, image, config=""):
+        '''Same as `pytesseract.image_to_string()`, run in process
+        '''
+        with self._recognize(image, config) as api:
+            return api.GetUTF8Text()
+
+    def detect_orientation(self, image):
+        '''Uses tesseract's orientation and script detection to find how far an image is rotated
+
+        :returns: degrees the image must be rotated clockwise to be right-way up, tesseract's
+            "Rotate:" field
+        :rtype: int
+        '''
+        api = self._api("osd", self._tesserocr.OEM.DEFAULT)
+        api.SetPageSegMode(self._tesserocr.PSM.OSD_ONLY)
+        _set_image(api, image)
+        try:
+            orientation = api.DetectOrientationScript()
+        finally:
+            api.Clear()
+        if not orientation:
+            raise RuntimeError("Tesseract could not detect the image's orientation. Too few characters?")
+
+        #Tesseract reports the page's counter-clockwise orientation. "Rotate:" is the clockwise
+        # turn that undoes it
+        return (360 - orientation["orient_deg"]) % 360
+
+    def version(self):
+        '''Returns the tesseract version, used to key the ocr cache
+        '''
+        return self._tesserocr.tesseract_version()
+
+    @contextlib.contextmanager
+    def _recognize(self, image, config):
+        '''Runs recognition of an image on this thread's api, set up for one ocr call. Yields the
+        api to read results from. The image is cleared and variables set by `config` are reset
+        afterwards
+        '''
+        options = _parse_config(config)
+        api = self._api(options["lang"] or self.lang, options["oem"])
+        api.SetPageSegMode(options["psm"])
+        defaults = {name: api.GetVariableAsString(name) for name in options["variables"]}
+        try:
+            for name, value in options["variables"].items():
+                api.SetVariable(name, value)
+            _set_image(api, image)
+            api.Recognize()
+            yield api
+        finally:
+            api.Clear()
+            for name, value in defaults.items():
+                api.SetVariable(name, value)
+
+    def _api(self, lang, oem):
+        '''Returns this thread's api for a language and engine mode, starting it on first use
+
+        Apis aren't shared between threads or inherited by forked processes
+        '''
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.pid = os.getpid()
+            self._local.apis = dict()
+
+        if (lang, oem) not in self._local.apis:
+            kwargs = {"lang": lang, "oem": oem}
+            if self.tessdata_path is not None:
+                kwargs["path"] = self.tessdata_path
+            self._local.apis[(lang, oem)] = self._tesserocr.PyTessBaseAPI(**kwargs)
+
+        return self._local.apis[(lang, oem)]
+
+
+def _import_tesserocr():
+    '''Imports tesserocr on first use. Only needed for TesserocrBackend
+    '''
+    try:
+        import tesserocr
+    except ImportError:
+        raise ImportError("""tesserocr is required to use TesserocrBackend. Install it with
+                          `pip install tesserocr`, or keep the default PytesseractBackend.""")
+
+    return tesserocr
+
+def _parse_config(config):
+    '''Parses a tesseract command line config string for the tesseract api
+
+    :returns: dict with the page segmentation mode "psm", engine mode "oem", language "lang" (None
+        unless given) and a dict of "-c" "variables"
+    :rtype: dict
+    '''
+    options = {"psm": 3, "oem": 3, "lang": None, "variables": dict()} #Command line defaults
+    tokens = shlex.split(config)
+    index = 0
+    while index < len(tokens):
+        option = tokens[index]
+        if option in ("--psm", "--oem", "-l", "-c") and index + 1 < len(tokens):
+            value = tokens[index + 1]
+            if option == "--psm":
+                options["psm"] = int(value)
+            elif option == "--oem":
+                options["oem"] = int(value)
+            elif option == "-l":
+                options["lang"] = value
+            else:
+                name, _, variable_value = value.partition("=")
+                options["variables"][name] = variable_value
+            index += 2
+        else:
+            raise ValueError(f"""Tesseract config option '{option}' isn't supported by TesserocrBackend.
+                            Supported options are --psm, --oem, -l and -c. Recieved config '{config}'""")
+
+    return options
+
+def _set_image(api, image):
+    '''Hands a numpy image to a tesserocr api. 8 bit grey and RGB arrays are passed as raw bytes,
+    anything else goes through PIL the same way pytesseract converts it
+    '''
+    image = np.ascontiguousarray(image)
+    if image.dtype == np.uint8 and (image.ndim == 2 or (image.ndim == 3 and image.shape[2] == 3)):
+        bytes_per_pixel = 1 if image.ndim == 2 else 3
+        api.SetImageBytes(image.tobytes(), image.shape[1], image.shape[0], bytes_per_pixel,
+                            image.shape[1] * bytes_per_pixel)
+    else:
+        api.SetImage(pytesseract.pytesseract.prepare(image)[0])
+
+
+###############################
+# Backend shared by every ocr call in ocirs
+###############################
+_ocr_backend = PytesseractBackend()
+
+def set_ocr_backend(ocr_backend):
+    '''Sets the ocr backend used by ocirs, e.g. `set_ocr_backend(TesserocrBackend())`
+
+    Worker processes started after this call (on platforms that fork) inherit the setting.
+
+    :param ocr_backend: PytesseractBackend or TesserocrBackend object
+    :type ocr_backend: object
+    '''
+    global _ocr_backend
+    _ocr_backend = ocr_backend
+
+def get_ocr_backend():
+    '''Returns the ocr backend used by ocirs. PytesseractBackend unless changed
+
+    :returns: ocr backend object
+    :rtype: object
+    '''
+    return _ocr_backend
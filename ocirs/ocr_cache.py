@@ -0,0 +1,183 @@
+import contextlib
+import functools
+import hashlib
+import pathlib
+import pickle
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pytesseract
+
+from ocirs.ocr_backends import get_ocr_backend
+
+
+#Cache location and size used unless `set_ocr_cache()` is handed another OCRCache
+DEFAULT_CACHE_PATH = pathlib.Path(tempfile.gettempdir(), "ocirs_ocr_cache.sqlite3")
+DEFAULT_MAX_BYTES = 512 * 1024**2 #512 MB
+
+
+class OCRCache():
+    '''An on-disk cache of tesseract ocr results, stored in a SQLite database
+
+    Results are keyed on the content of the image handed to tesseract (its pixels, shape and
+    dtype), the tesseract config string, the requested output type and the tesseract version
+    reported by the ocr backend (see `ocirs.ocr_backends`). The same page ocr'ed again, whether
+    from a rerun, an amended filing or a second download of the same pdf, is then read back
+    instead of being ocr'ed.
+
+    When stored results grow past `max_bytes`, the least recently used results are deleted.
+    SQLite handles locking, so one cache file can be shared by every worker process of
+    `NineNinetyForm.extract_pages()`.
+    '''
+
+    def __init__(self, cache_path=None, max_bytes=DEFAULT_MAX_BYTES):
+
+        self.cache_path = pathlib.Path(cache_path) if cache_path else DEFAULT_CACHE_PATH
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS ocr_results (
+                                    key TEXT PRIMARY KEY,
+                                    result BLOB NOT NULL,
+                                    size INTEGER NOT NULL,
+                                    last_used REAL NOT NULL)""")
+            connection.execute("CREATE INDEX IF NOT EXISTS ocr_results_last_used ON ocr_results (last_used)")
+
+    def image_to_data(self, image, config="", output_type=pytesseract.Output.DATAFRAME):
+        '''Drop in replacement for `pytesseract.image_to_data()` that reads and fills the cache
+
+        :param image: image to ocr
+        :type image: numpy array
+        :param config: tesseract config string
+        :type config: string
+        :param output_type: pytesseract output type, default `pytesseract.Output.DATAFRAME`
+        :type output_type: string
+
+        :returns: ocr data in the requested output type
+        '''
+        key = self.key(image, config, output_type)
+
+        ocr_data = self.get(key)
+        if ocr_data is None:
+            ocr_data = get_ocr_backend().image_to_data(image, config=config, output_type=output_type)
+            self.put(key, ocr_data)
+
+        return ocr_data
+
+    def key(self, image, config, output_type):
+        '''Returns the cache key of an ocr request
+
+        :returns: sha256 hex digest
+        :rtype: string
+        '''
+        image = np.ascontiguousarray(image)
+
+        sha256 = hashlib.sha256(image.data)
+        sha256.update(f"{image.shape}|{image.dtype.str}|{config}|{output_type}|"
+                        f"{_tesseract_version(get_ocr_backend())}".encode())
+
+        return sha256.hexdigest()
+
+    def get(self, key):
+        '''Returns the cached ocr data for a key, or None if it isn't cached
+        '''
+        with self._connect() as connection:
+            row = connection.execute("SELECT result FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE ocr_results SET last_used = ? WHERE key = ?", (time.time(), key))
+
+        return pickle.loads(row[0])
+
+    def put(self, key, ocr_data):
+        '''Stores ocr data under a key, then evicts old results if the cache is too large
+        '''
+        result = pickle.dumps(ocr_data, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO ocr_results VALUES (?, ?, ?, ?)",
+                                (key, result, len(result), time.time()))
+        self.evict()
+
+    def evict(self):
+        '''Deletes least recently used results until the cache is no larger than `max_bytes`
+        '''
+        with self._connect() as connection:
+            total_bytes = connection.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchone()[0]
+            if total_bytes <= self.max_bytes:
+                return
+
+            evicted_keys = []
+            for key, size in connection.execute("SELECT key, size FROM ocr_results ORDER BY last_used"):
+                if total_bytes <= self.max_bytes:
+                    break
+                evicted_keys.append((key,))
+                total_bytes -= size
+            connection.executemany("DELETE FROM ocr_results WHERE key = ?", evicted_keys)
+
+    def clear(self):
+        '''Deletes every cached result
+        '''
+        with self._connect() as connection:
+            connection.execute("DELETE FROM ocr_results")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        '''Opens a connection for one transaction. Connections aren't shared, so the cache can be
+        used from any thread or process
+        '''
+        connection = sqlite3.connect(self.cache_path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+@functools.lru_cache(maxsize=None)
+def _tesseract_version(ocr_backend):
+    return ocr_backend.version()
+
+
+###############################
+# Cache shared by NineNinetyPage.ocr() and table extraction
+###############################
+_DEFAULT = object() #Marks that the default cache hasn't been created yet
+_ocr_cache = _DEFAULT
+
+def set_ocr_cache(ocr_cache):
+    '''Sets the OCRCache used by ocirs. Pass None to turn ocr caching off
+
+    Worker processes started after this call (on platforms that fork) inherit the setting.
+
+    :param ocr_cache: OCRCache object or None
+    :type ocr_cache: OCRCache
+    '''
+    global _ocr_cache
+    _ocr_cache = ocr_cache
+
+def get_ocr_cache():
+    '''Returns the OCRCache used by ocirs, creating the default cache on first use
+
+    :returns: OCRCache object, or None if ocr caching is turned off
+    :rtype: OCRCache
+    '''
+    global _ocr_cache
+    if _ocr_cache is _DEFAULT:
+        _ocr_cache = OCRCache()
+
+    return _ocr_cache
+
+def image_to_data(image, config="", output_type=pytesseract.Output.DATAFRAME):
+    '''`pytesseract.image_to_data()`, run by the ocirs ocr backend, through the ocirs ocr cache if
+    caching is turned on
+    '''
+    ocr_cache = get_ocr_cache()
+    if ocr_cache is None:
+        return get_ocr_backend().image_to_data(image, config=config, output_type=output_type)
+
+    return ocr_cache.image_to_data(image, config=config, output_type=output_type)
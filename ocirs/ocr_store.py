@@ -0,0 +1,152 @@
+import json
+
+import pandas as pd
+
+
+###############################
+# Column types of a pytesseract.Output.DATAFRAME once stored. Every column is optional, so
+# projected dataframes can be stored too. Columns not listed here, such as `conf`, keep the dtype
+# pytesseract returned them with
+###############################
+OCR_STORE_INT_COLUMNS = ("level", "page_num", "block_num", "par_num", "line_num", "word_num",
+                         "left", "top", "width", "height")
+OCR_STORE_TEXT_COLUMNS = ("text",)
+
+#Schema metadata key listing every stored page index, including pages without any ocr rows
+OCR_STORE_PAGE_INDICES_KEY = b"ocirs_page_indices"
+
+#File extension of each columnar save_type
+OCR_STORE_EXTENSIONS = {"parquet": "parquet", "arrow": "arrow"}
+
+
+def _import_pyarrow():
+    '''Imports pyarrow on first use. Only needed for the columnar ocr store
+    '''
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("""pyarrow is required to save or load 'parquet' and 'arrow' ocr stores.
+                          Install it with `pip install pyarrow`, or use 'csv' or 'pickle' instead.""")
+
+    return pyarrow
+
+
+def write_ocr_store(pages, store_path, save_type):
+    '''Saves the ocr data of a list of NineNinetyPage objects to a single columnar file
+
+    Every page's ocr_dataframe is stacked into one table with an added `page_index` column.
+    Integer columns are stored as int32 and `text` dictionary encoded. Other columns, such as
+    `conf`, are stored with their own dtype so they read back unchanged. The page indices are also
+    listed in the file's metadata, so pages with no ocr rows are kept too.
+
+    * "parquet" files are compressed and the smallest on disk.
+    * "arrow" files (Arrow IPC) are uncompressed, so `read_ocr_store()` can memory map them and
+    load columns without copying or decoding them.
+
+    :param pages: list of NineNinetyPage objects
+    :type pages: list
+    :param store_path: path of the file to write
+    :type store_path: string
+    :param save_type: either "parquet" or "arrow"
+    :type save_type: string
+    '''
+    pa = _import_pyarrow()
+
+    ocr_dataframes = [page.ocr_dataframe.assign(page_index=page.index) for page in pages]
+    ocr_dataframe = pd.concat(ocr_dataframes, ignore_index=True) if ocr_dataframes else pd.DataFrame({"page_index": []})
+
+    ###############################
+    # Build typed arrow columns
+    ###############################
+    columns = {"page_index": pa.array(ocr_dataframe["page_index"], type=pa.int32())}
+    for column in ocr_dataframe.columns:
+        if column in OCR_STORE_INT_COLUMNS:
+            columns[column] = pa.array(ocr_dataframe[column], type=pa.int32())
+        elif column in OCR_STORE_TEXT_COLUMNS:
+            #pandas may have parsed some words as numbers. Store everything but missing values as text
+            text = ocr_dataframe[column].astype(object)
+            is_text = text.notna()
+            text[is_text] = text[is_text].map(str)
+            text[~is_text] = None
+            columns[column] = pa.array(text, type=pa.string()).dictionary_encode()
+        elif column != "page_index":
+            columns[column] = pa.array(ocr_dataframe[column])
+    table = pa.table(columns).replace_schema_metadata({
+        OCR_STORE_PAGE_INDICES_KEY: json.dumps([page.index for page in pages])
+    })
+
+    if save_type == "parquet":
+        pa.parquet.write_table(table, store_path, compression="zstd", use_dictionary=True)
+    else:
+        with pa.OSFile(str(store_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def read_ocr_store(store_path, page_index_list=None, columns=None):
+    '''Loads ocr dataframes from a file written by `write_ocr_store()`
+
+    The file is memory mapped. Only the requested columns and pages are read.
+
+    :param store_path: path to a ".parquet" or ".arrow" ocr store
+    :type store_path: string
+    :param page_index_list: page indices to load. Default None loads every page in the store
+    :type page_index_list: list
+    :param columns: ocr dataframe columns to load. Default None loads every column
+    :type columns: list
+
+    :returns: dict of page index: ocr dataframe, ordered by page index. Stored pages without any
+    ocr rows get an empty dataframe
+    :rtype: dict
+    '''
+    pa = _import_pyarrow()
+
+    read_columns = None if columns is None else ["page_index"] + [column for column in columns
+                                                                if column != "page_index"]
+
+    if str(store_path).endswith(".parquet"):
+        filters = None if page_index_list is None else [("page_index", "in",
+                                                        [int(page_index) for page_index in page_index_list])]
+        table = pa.parquet.read_table(store_path, columns=read_columns, filters=filters,
+                                        memory_map=True)
+    else:
+        with pa.memory_map(str(store_path), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        if read_columns is not None:
+            table = table.select(read_columns)
+        if page_index_list is not None:
+            page_indices = pa.array([int(page_index) for page_index in page_index_list], type=pa.int32())
+            table = table.filter(pa.compute.is_in(table["page_index"], value_set=page_indices))
+
+    ocr_dataframe = table.to_pandas()
+
+    #Dictionary encoded text comes back as categorical. Restore the object column pytesseract uses
+    for column in OCR_STORE_TEXT_COLUMNS:
+        if column in ocr_dataframe.columns:
+            ocr_dataframe[column] = ocr_dataframe[column].astype(object)
+    #Integer columns come back as the int64 columns pytesseract uses
+    for column in OCR_STORE_INT_COLUMNS:
+        if column in ocr_dataframe.columns:
+            ocr_dataframe[column] = ocr_dataframe[column].astype("int64")
+
+    ocr_dataframes = {int(page_index): page_dataframe.drop(columns="page_index").reset_index(drop=True)
+                        for page_index, page_dataframe in ocr_dataframe.groupby("page_index")}
+
+    ###############################
+    # Add the requested pages that were stored without any ocr rows
+    ###############################
+    metadata = table.schema.metadata or {}
+    if OCR_STORE_PAGE_INDICES_KEY in metadata:
+        stored_page_indices = {int(page_index) for page_index
+                                in json.loads(metadata[OCR_STORE_PAGE_INDICES_KEY])
+                                if page_index is not None}
+        if page_index_list is not None:
+            stored_page_indices &= {int(page_index) for page_index in page_index_list}
+        empty_dataframe = ocr_dataframe.iloc[0:0].drop(columns="page_index")
+        for page_index in stored_page_indices - ocr_dataframes.keys():
+            ocr_dataframes[page_index] = empty_dataframe.copy()
+
+    return {page_index: ocr_dataframes[page_index] for page_index in sorted(ocr_dataframes)}
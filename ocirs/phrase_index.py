@@ -0,0 +1,214 @@
+import fuzzysearch #Fuzzysearch for verifying candidate phrase matches
+import numpy as np
+
+
+class PhraseIndex():
+    '''A multi-pattern approximate string matcher for labelled search phrases
+
+    Finds which labels have at least one phrase within `max_l_dist` levenshtein distance of some
+    part of a text, with the same result as running `fuzzysearch.find_near_matches()` for every
+    phrase over the whole text.
+
+    Each phrase is split into `max_l_dist + 1` pieces. A match with at most `max_l_dist` edits
+    can't touch every piece, so at least one piece appears in the text unchanged. The text is
+    lowercased once and the pieces of all phrases, shared between phrases where they repeat, are
+    located with exact substring search. Fuzzysearch then only runs on the short windows around
+    piece hits, and not at all for labels that already matched.
+
+    For example:
+    ```
+    phrase_index = PhraseIndex({"SkdIRcpntTbl": ["Grants to Organizations", ...], ...})
+    phrase_index.search(page_text) #{"SkdIRcpntTbl"}
+    ```
+    '''
+
+    def __init__(self, labelled_phrases, max_l_dist=4):
+
+        self.max_l_dist = max_l_dist
+        self.phrases = [] #List of (label, lowercased phrase)
+        self.short_phrase_ids = [] #Phrases too short to split. Searched over the full text
+        piece_locations = {} #piece: list of (phrase id, offset of piece in phrase)
+
+        for label, phrase_list in labelled_phrases.items():
+            for phrase in phrase_list:
+                phrase_id = len(self.phrases)
+                phrase = phrase.lower()
+                self.phrases.append((label, phrase))
+
+                if len(phrase) <= max_l_dist:
+                    self.short_phrase_ids.append(phrase_id)
+                    continue
+
+                for offset, piece in self._split_phrase(phrase, max_l_dist + 1):
+                    piece_locations.setdefault(piece, []).append((phrase_id, offset))
+
+        self._piece_locations = piece_locations
+
+    def search(self, text):
+        '''Returns the labels with a phrase matching somewhere in `text`
+
+        :param text: text to search, e.g. a page's `ocr_dataframe_to_text()`
+        :type text: string
+
+        :returns: set of matched labels
+        :rtype: set
+        '''
+        text = text.lower()
+        matched_labels = set()
+
+        for phrase_id in self.short_phrase_ids:
+            label, phrase = self.phrases[phrase_id]
+            if label not in matched_labels and self._is_near_match(phrase, text):
+                matched_labels.add(label)
+
+        ###############################
+        # Locate every piece. An unchanged piece sits at most max_l_dist characters away from where
+        # it would be in an exact match of its phrase, which bounds the window that could hold a
+        # match of the phrase
+        ###############################
+        phrase_windows = {} #phrase id: list of (window start, window end)
+        for piece, locations in self._piece_locations.items():
+            piece_start = text.find(piece)
+            while piece_start != -1:
+                for phrase_id, offset in locations:
+                    window_start = max(piece_start - offset - self.max_l_dist, 0)
+                    window_end = piece_start - offset + len(self.phrases[phrase_id][1]) + 2 * self.max_l_dist
+                    phrase_windows.setdefault(phrase_id, []).append((window_start, window_end))
+                piece_start = text.find(piece, piece_start + 1)
+
+        ###############################
+        # Then verify each phrase with fuzzysearch, once per run of overlapping windows
+        ###############################
+        for phrase_id, windows in phrase_windows.items():
+            label, phrase = self.phrases[phrase_id]
+            if label in matched_labels:
+                continue
+
+            for window_start, window_end in self._merge_windows(windows):
+                if self._is_near_match(phrase, text[window_start:window_end]):
+                    matched_labels.add(label)
+                    break
+
+        return matched_labels
+
+    def _is_near_match(self, phrase, text):
+        return len(fuzzysearch.find_near_matches(phrase, text, max_l_dist=self.max_l_dist)) > 0
+
+    @staticmethod
+    def _merge_windows(windows):
+        '''Merges overlapping (start, end) windows
+        '''
+        merged_windows = []
+        for window_start, window_end in sorted(windows):
+            if merged_windows and window_start <= merged_windows[-1][1]:
+                merged_windows[-1][1] = max(merged_windows[-1][1], window_end)
+            else:
+                merged_windows.append([window_start, window_end])
+
+        return merged_windows
+
+    @staticmethod
+    def _split_phrase(phrase, piece_count):
+        '''Splits a phrase into `piece_count` contiguous, near equal length pieces
+
+        :returns: list of (offset of piece in phrase, piece)
+        :rtype: list
+        '''
+        boundaries = [len(phrase) * piece_number // piece_count
+                        for piece_number in range(piece_count + 1)]
+
+        return [(boundaries[piece_number], phrase[boundaries[piece_number]:boundaries[piece_number + 1]])
+                for piece_number in range(piece_count)]
+
+
+class QGramFilter():
+    '''A cheap prefilter that rules out texts that can't contain an approximate match of a phrase
+
+    Based on the q-gram lemma: if some part of a text is within `max_l_dist` levenshtein distance
+    of a phrase of length m, then each edit spoils at most q of the phrase's m - q + 1 q-grams,
+    so at least m - q + 1 - q * max_l_dist of them also appear in the text. A text whose q-gram
+    set holds fewer than that can be skipped without changing any match result.
+
+    Q-grams are packed into integers (21 bits per character), so a text's q-gram set is a sorted
+    numpy array that can be computed once and reused for every phrase.
+
+    `hits` counts phrase checks that passed the filter and still need a fuzzy search. `rejects`
+    counts phrase checks the filter ruled out.
+    '''
+
+    def __init__(self, q=3):
+
+        if q not in (1, 2, 3):
+            raise ValueError(f"q must be 1, 2 or 3 for q-grams to fit in 64 bits. Recieved {q}")
+
+        self.q = q
+        self.hits = 0
+        self.rejects = 0
+        self._phrase_qgrams = {} #Memo of lowercased phrase: q-gram of every phrase position
+
+    def text_qgrams(self, text):
+        '''Returns the set of lowercase q-grams in a text
+
+        :param text: text to compute q-grams for
+        :type text: string
+
+        :returns: sorted numpy array of unique packed q-grams
+        :rtype: numpy array
+        '''
+        qgrams = np.sort(self._packed_qgrams(text.lower()))
+        #Drop repeats by comparing sorted neighbours. Cheaper than np.unique for page-sized arrays
+        return qgrams[np.concatenate(([True], qgrams[1:] != qgrams[:-1]))] if len(qgrams) else qgrams
+
+    def could_match(self, phrase, text_qgrams, max_l_dist):
+        '''Checks whether a text could contain an approximate match of a phrase
+
+        :param phrase: phrase to search for
+        :type phrase: string
+        :param text_qgrams: q-gram set of the text, from `text_qgrams()`
+        :type text_qgrams: numpy array
+        :param max_l_dist: maximum levenshtein distance of a match
+        :type max_l_dist: integer
+
+        :returns: False if the text can't contain a match, True if it might
+        :rtype: bool
+        '''
+        phrase = phrase.lower()
+        if phrase not in self._phrase_qgrams:
+            self._phrase_qgrams[phrase] = self._packed_qgrams(phrase)
+        phrase_qgrams = self._phrase_qgrams[phrase]
+
+        required_qgrams = len(phrase_qgrams) - self.q * max_l_dist
+        if required_qgrams <= 0: #Too short a phrase, or too many edits allowed, to rule anything out
+            self.hits += 1
+            return True
+
+        positions = np.searchsorted(text_qgrams, phrase_qgrams)
+        positions[positions == len(text_qgrams)] = 0
+        shared_qgrams = np.count_nonzero(text_qgrams[positions] == phrase_qgrams) if len(text_qgrams) else 0
+
+        if shared_qgrams < required_qgrams:
+            self.rejects += 1
+            return False
+
+        self.hits += 1
+        return True
+
+    def reset_counters(self):
+        '''Sets `hits` and `rejects` back to 0
+        '''
+        self.hits = 0
+        self.rejects = 0
+
+    def _packed_qgrams(self, text):
+        '''Returns the q-gram at every position of a text, packed into integers
+        '''
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype="<u4").astype(np.uint64)
+        qgram_count = len(codes) - self.q + 1
+        if qgram_count <= 0:
+            return np.zeros(0, dtype=np.uint64)
+
+        qgrams = np.zeros(qgram_count, dtype=np.uint64)
+        for offset in range(self.q):
+            qgrams = (qgrams << np.uint64(21)) | codes[offset:offset + qgram_count]
+
+        return qgrams
@@ -0,0 +1,226 @@
+import collections
+import hashlib
+import os
+import pathlib
+import tempfile
+import threading
+import weakref
+
+from pdf2image import convert_from_path, pdfinfo_from_path #pdf to image handling
+
+
+#Cache location and size used when a NineNinetyForm isn't handed its own RasterCache
+DEFAULT_CACHE_DIR = pathlib.Path(tempfile.gettempdir(), "ocirs_raster_cache")
+DEFAULT_MAX_BYTES = 2 * 1024**3 #2 GB
+
+#Cached page images in use by live NineNinetyPage objects, path: number of users. Shared by every
+# RasterCache in the process, so one form's eviction never deletes another form's pages
+_pinned_paths = collections.Counter()
+_pinned_paths_lock = threading.Lock()
+
+
+class RasterCache():
+    '''An on-disk cache of rasterized pdf pages
+
+    Page images are keyed on the content hash of the pdf, the dpi they were rendered at and their
+    page index (counting from 0). Only pages that are requested and not already cached are
+    rendered, using pdf2image's `first_page`/`last_page` options so a handful of pages never costs
+    a full document conversion.
+
+    Cached images are kept after use so later calls (and later NineNinetyForm instances of the
+    same pdf) can reuse them. When the cached page images grow past `max_bytes`, the least recently
+    used ones are deleted. Page images pinned with `pin()`, such as those of live NineNinetyPage
+    objects, are never deleted. Pins only hold within one process, so processes sharing a cache
+    directory should leave room in `max_bytes` for each other's pages.
+    '''
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._pdf_hashes = {} #Memo of (path, mtime, size): content hash. Avoids re-hashing pdfs
+
+    def pdf_hash(self, pdf_path):
+        '''Returns the sha256 hex digest of a pdf's contents
+
+        :param pdf_path: path to pdf file
+        :type pdf_path: string
+
+        :returns: sha256 hex digest
+        :rtype: string
+        '''
+        pdf_path = pathlib.Path(pdf_path)
+        stat = pdf_path.stat()
+        memo_key = (str(pdf_path.resolve()), stat.st_mtime_ns, stat.st_size)
+
+        if memo_key not in self._pdf_hashes:
+            sha256 = hashlib.sha256()
+            with open(pdf_path, "rb") as pdf_file:
+                for chunk in iter(lambda: pdf_file.read(1024 * 1024), b""):
+                    sha256.update(chunk)
+            self._pdf_hashes[memo_key] = sha256.hexdigest()
+
+        return self._pdf_hashes[memo_key]
+
+    def page_count(self, pdf_path):
+        '''Returns the number of pages in a pdf
+        '''
+        return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+    def page_path(self, pdf_hash, dpi, page_index):
+        '''Returns the cache path of a rendered page, whether or not it exists yet
+        '''
+        return self.cache_dir / f"{pdf_hash}_{dpi}_{page_index}.png"
+
+    def get_page_paths(self, pdf_path, page_indices=None, dpi=300):
+        '''Returns paths to grayscale images of the requested pdf pages, rendering missing pages
+
+        :param pdf_path: path to pdf file
+        :type pdf_path: string
+        :param page_indices: page indices (counting from 0) to return. Default None returns all pages
+        :type page_indices: list
+        :param dpi: resolution to render pages at, default 300
+        :type dpi: int
+
+        :returns: list of image paths, in the same order as `page_indices`
+        :rtype: list
+        '''
+        if page_indices is None:
+            page_indices = range(self.page_count(pdf_path))
+        page_indices = [int(page_index) for page_index in page_indices]
+
+        pdf_hash = self.pdf_hash(pdf_path)
+        page_paths = {page_index: self.page_path(pdf_hash, dpi, page_index)
+                        for page_index in page_indices}
+
+        ##########################
+        # Mark cache hits as recently used, render everything else in contiguous runs of pages
+        ##########################
+        missing_pages = []
+        for page_index, page_path in sorted(page_paths.items()):
+            if page_path.is_file():
+                os.utime(page_path)
+            else:
+                missing_pages.append(page_index)
+
+        for first_page, last_page in self._contiguous_runs(missing_pages):
+            self._render(pdf_path, pdf_hash, dpi, first_page, last_page)
+
+        self.evict(keep=set(page_paths.values()))
+
+        return [str(page_paths[page_index]) for page_index in page_indices]
+
+    def evict(self, keep=()):
+        '''Deletes least recently used page images until they take up no more than `max_bytes`
+
+        Decoded copies of page images (the .npy files of `NineNinetyPage(image_cache="mmap")`)
+        don't count towards `max_bytes`. They are deleted along with their page image.
+
+        :param keep: cache paths that must not be deleted, e.g. pages that were just requested.
+        Pinned paths are never deleted either
+        :type keep: set
+        '''
+        cached_pages = []
+        decoded_paths = []
+        total_bytes = 0
+        for cached_path in self.cache_dir.iterdir():
+            if not cached_path.is_file():
+                continue
+            if cached_path.suffix == ".npy":
+                decoded_paths.append(cached_path)
+            elif cached_path.suffix == ".png":
+                stat = cached_path.stat()
+                cached_pages.append((stat.st_mtime, stat.st_size, cached_path))
+                total_bytes += stat.st_size
+            #Anything else, such as a .tmp file still being written, is left alone
+
+        for _, size, cached_path in sorted(cached_pages, key=lambda cached_page: cached_page[0]):
+            if total_bytes <= self.max_bytes:
+                break
+            if cached_path in keep or is_pinned(cached_path):
+                continue
+            self._delete(cached_path)
+            total_bytes -= size
+
+        #Delete decoded copies whose page image is gone, whether evicted here or elsewhere
+        for decoded_path in decoded_paths:
+            if not decoded_path.with_suffix("").is_file():
+                self._delete(decoded_path)
+
+    @staticmethod
+    def _delete(cached_path):
+        '''Deletes a cache file, ignoring files that are already gone or still open elsewhere
+        '''
+        try:
+            cached_path.unlink()
+        except FileNotFoundError: #Another process already evicted it
+            pass
+        except PermissionError: #Still memory mapped on a platform that won't delete open files
+            pass
+
+    def _render(self, pdf_path, pdf_hash, dpi, first_page, last_page):
+        '''Renders a contiguous run of pages into the cache
+        '''
+        #Render into a scratch directory inside the cache dir, then move into place. Keeps
+        # concurrent readers from ever seeing a half written page image
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as temp_path:
+            image_paths = convert_from_path(pdf_path, dpi=dpi, grayscale=True, fmt="png",
+                                            first_page=first_page + 1, last_page=last_page + 1,
+                                            paths_only=True, output_folder=temp_path)
+            for offset, image_path in enumerate(image_paths):
+                os.replace(image_path, self.page_path(pdf_hash, dpi, first_page + offset))
+
+    @staticmethod
+    def _contiguous_runs(page_indices):
+        '''Groups sorted page indices into (first, last) runs of consecutive pages
+        '''
+        runs = []
+        for page_index in page_indices:
+            if runs and page_index == runs[-1][1] + 1:
+                runs[-1][1] = page_index
+            else:
+                runs.append([page_index, page_index])
+
+        return [tuple(run) for run in runs]
+
+
+###############################
+# Pinning of page images in use
+###############################
+def pin(path, owner=None):
+    '''Protects a cached page image from eviction until it is unpinned
+
+    If an `owner` object is given, the path is unpinned automatically when the owner is garbage
+    collected. Pins are counted, so a path pinned twice must be unpinned twice.
+
+    :param path: page image path
+    :type path: string
+    :param owner: object the pin lasts as long as, e.g. a NineNinetyPage. Default None pins until
+    `unpin()` is called
+    :type owner: object
+
+    :returns: `weakref.finalize` object that unpins the path early when called, or None if no
+    owner was given
+    :rtype: object
+    '''
+    pinned_path = os.path.abspath(path)
+    with _pinned_paths_lock:
+        _pinned_paths[pinned_path] += 1
+
+    return weakref.finalize(owner, unpin, pinned_path) if owner is not None else None
+
+def unpin(path):
+    '''Removes one pin from a page image, see `pin()`
+    '''
+    pinned_path = os.path.abspath(path)
+    with _pinned_paths_lock:
+        _pinned_paths[pinned_path] -= 1
+        if _pinned_paths[pinned_path] <= 0:
+            del _pinned_paths[pinned_path]
+
+def is_pinned(path):
+    '''Returns whether a page image is pinned, see `pin()`
+    '''
+    with _pinned_paths_lock:
+        return os.path.abspath(path) in _pinned_paths
@@ -1,31 +1,88 @@
 from mmdet.apis import init_detector, inference_detector
 import cv2
+import torch
 
 import os
+import threading
 from os.path import dirname, realpath
 pwd = dirname(realpath(__file__))
 config_file_path = realpath(os.path.join(pwd, 'config', 'cascade_mask_rcnn_hrnetv2p_w32_20e.py'))
 checkpoint_file_path = realpath(os.path.join(pwd, 'model_checkpoint', 'epoch_36.pth'))
 
-def cascadetabnet_crop_table(model, image):
+#Environment variable that sets the device models are loaded on, e.g. "cpu" or "cuda:1"
+DEVICE_ENV_VAR = "OCIRS_CASCADETABNET_DEVICE"
+
+#Models loaded by get_model(), keyed on (config path, checkpoint path, device). Loaded once per process
+_models = {}
+_models_lock = threading.Lock()
+
+def cascadetabnet_crop_table(model, image, crop_image=None):
     '''
     crop_form will be the main function for the cascadeTabNet process, taking in a file (img) and returning a list of tuples each representing a detected table
     Each tuple consists of two components. First a numpy-array representation of the cropped table image. Second an assertion of whether the table is bordered or borderless 
+
+    Tables are detected in `image` and cropped from `crop_image`, if provided. `crop_image` must have the same height and width, e.g. a greyscale copy of `image`
     '''
 
     result = table_bounds(model, image)
 
-    table_imgs = table_crop(image, result)
+    table_imgs = table_crop(crop_image if crop_image is not None else image, result)
 
     return table_imgs
 
 
-def define_model(config_file_path=config_file_path, checkpoint_file_path=checkpoint_file_path):
+def cascadetabnet_crop_tables_batch(model, images, crop_images=None):
+    '''
+    Batch version of cascadetabnet_crop_table(). Detects tables in every image of `images` with a single inference call
+
+    Returns a list with one list of (cropped table image, table type) tuples per image
+    '''
+
+    results = table_bounds_batch(model, images)
+
+    if crop_images is None:
+        crop_images = images
+
+    return [table_crop(crop_image, result) for crop_image, result in zip(crop_images, results)]
+
+
+#Detection backend entry point. See ocirs.table_detection.registry
+crop_tables_batch = cascadetabnet_crop_tables_batch
+
+
+def default_device():
+    '''
+    Device to load models on. The OCIRS_CASCADETABNET_DEVICE environment variable if set, otherwise the first CUDA gpu if available, otherwise the cpu
+    '''
+    if os.environ.get(DEVICE_ENV_VAR):
+        return os.environ[DEVICE_ENV_VAR]
+
+    return 'cuda:0' if torch.cuda.is_available() else 'cpu'
+
+
+def define_model(config_file_path=config_file_path, checkpoint_file_path=checkpoint_file_path, device=None):
+    '''
+    Loads a new CascadeTabNet model. Slow, since it reads the checkpoint and builds the network. Use get_model() to reuse an already loaded model
+    '''
   
-    model = init_detector(config_file_path, checkpoint_file_path, device='cuda:0')
+    model = init_detector(config_file_path, checkpoint_file_path, device=device or default_device())
 
     return model
 
+
+def get_model(device=None, config_file_path=config_file_path, checkpoint_file_path=checkpoint_file_path):
+    '''
+    Returns the CascadeTabNet model for a device, loading it on first use. Each model is only loaded once per process
+    '''
+    model_key = (config_file_path, checkpoint_file_path, device or default_device())
+
+    with _models_lock:
+        if model_key not in _models:
+            _models[model_key] = define_model(*model_key)
+
+    return _models[model_key]
+
+
 def table_bounds(model, image):
 
 
@@ -34,6 +91,17 @@ def table_bounds(model, image):
     return result
 
 
+def table_bounds_batch(model, images):
+    '''
+    Runs detection on a list of images in one inference_detector call. Returns one result per image
+    '''
+
+    #Older mmdet versions return a generator for lists of images, newer ones a list
+    results = list(inference_detector(model, list(images)))
+
+    return results
+
+
 def table_crop(image, result):
 
     table_imgs = [] #List containting all images of detected tables
@@ -88,7 +156,7 @@ def table_crop(image, result):
 if __name__ =="__main__":
 
     
-    model = define_model()
+    model = get_model()
 
     image_path = realpath(os.path.join(pwd, 'test_image.jpg'))
 
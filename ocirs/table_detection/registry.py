@@ -0,0 +1,96 @@
+import importlib
+import threading
+
+
+#Entry point group third-party packages can use to add detection backends
+ENTRY_POINT_GROUP = "ocirs.table_detection"
+
+#Built in detection backends: name: module path. Modules are only imported on first use
+_backend_modules = {
+    "cascadetabnet": "ocirs.table_detection.cascadetabnet"
+}
+_loaded_backends = {} #name: imported backend module
+_failed_backends = {} #name: import error. Heavy imports that failed aren't retried
+_backends_lock = threading.Lock()
+
+
+def register_backend(name, module_path):
+    '''Registers a table detection backend without importing it
+
+    A backend is a module exposing two functions:
+    * `get_model(device=None)`: returns a loaded detection model, loading it once per process
+    * `crop_tables_batch(model, images, crop_images=None)`: detects tables in a list of images and
+    returns one list of (cropped table image, "bordered" or "borderless") tuples per image
+
+    :param name: backend name, e.g. "cascadetabnet"
+    :type name: string
+    :param module_path: dotted import path of the backend module
+    :type module_path: string
+    '''
+    with _backends_lock:
+        _backend_modules[name] = module_path
+        _loaded_backends.pop(name, None)
+        _failed_backends.pop(name, None)
+
+def available_backends():
+    '''Returns the names of every registered backend, including those from entry points. Does
+    not import any backend
+
+    :returns: sorted list of backend names
+    :rtype: list
+    '''
+    _discover_entry_points()
+
+    return sorted(_backend_modules)
+
+def get_backend(name):
+    '''Returns a table detection backend module, importing it on first use
+
+    :param name: backend name, e.g. "cascadetabnet"
+    :type name: string
+
+    :returns: backend module
+    :rtype: module
+    '''
+    if name not in _backend_modules:
+        _discover_entry_points()
+    if name not in _backend_modules:
+        raise ValueError(f"""Table detection backend '{name}' not found.
+                        Available backends: {available_backends()}""")
+
+    with _backends_lock:
+        if name not in _loaded_backends and name not in _failed_backends:
+            try:
+                _loaded_backends[name] = importlib.import_module(_backend_modules[name])
+            except Exception as error:
+                _failed_backends[name] = error
+
+    if name in _failed_backends:
+        raise Exception(f"""Error establishing {name} table detection process. Make sure all relevant
+                        dependances are installed, or set `use_cascadetabnet=False`.
+                        Import error: {_failed_backends[name]!r}""") from _failed_backends[name]
+
+    return _loaded_backends[name]
+
+def _discover_entry_points():
+    '''Registers backends advertised by installed packages under ENTRY_POINT_GROUP. Entry points
+    are read, not loaded. Skipped on Pythons without importlib.metadata (< 3.8) unless the
+    importlib_metadata backport is installed
+    '''
+    try:
+        from importlib import metadata
+    except ImportError:
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            return
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+    else: #Python < 3.10 returns a dict of group: entry points
+        entry_points = entry_points.get(ENTRY_POINT_GROUP, [])
+
+    with _backends_lock:
+        for entry_point in entry_points:
+            _backend_modules.setdefault(entry_point.name, entry_point.value)
@@ -1,3 +1,5 @@
+import numpy as np
+
 from ocirs.table_extraction.borderless_table_extraction import get_text_boxes, text_boxes_to_table
 from ocirs.table_extraction.line_detector.line_detector import LineDetector
 
@@ -19,41 +21,53 @@ def get_bordered_table_OI(image, ocr_dataframe=None):
     return table 
     
 def assign_rows(horiz_lines, text_boxes):
-    row_ranges = list()
-    for index, horiz_line in enumerate(horiz_lines[:len(horiz_lines) - 1]):
-        x1, y1, x2, y2 = tuple(horiz_line)
-        row_ranges.append((y1, horiz_lines[index + 1][1]+5)) 
-    text_y2 = text_boxes["y2"].values.tolist() #text_y2  represents the bottom of the each word
-    text_y1 = text_boxes["top"].values.tolist() #text_y1 represents the top of each word
-    row_indexes = list()
-    
-    for y1,y2 in zip(text_y1,text_y2):
-        for index, (min, max) in enumerate(row_ranges):
-            if y2 <= max and y1 >= min: #If the bottom of the word does not go beyond the max distance down the page of the row
-                row_indexes.append(index)
-                break
-        else: #Not sure this part is ever called
-            row_indexes.append(None)
-    text_boxes["row"] = row_indexes
+    '''Assigns each text box the first row it fits inside
+
+    Row i spans from the top of horizontal line i down to 5 pixels past horizontal line i + 1. A
+    box fits when its top is at or below the row's top and its bottom is at or above the row's
+    bottom. Boxes that fit no row get no row (NaN)
+    '''
+    horiz_lines = np.asarray(horiz_lines, dtype=np.int64).reshape(-1, 4)
+    row_mins = horiz_lines[:-1, 1]
+    row_maxes = horiz_lines[1:, 1] + 5
+    text_y2 = text_boxes["y2"].to_numpy() #text_y2  represents the bottom of the each word
+    text_y1 = text_boxes["top"].to_numpy() #text_y1 represents the top of each word
+
+    if _is_sorted(row_mins) and _is_sorted(row_maxes):
+        #Rows fitting the bottom of the word start at the first row whose max isn't above it. Rows
+        # fitting the top of the word end at the last row whose min isn't below it
+        first_fitting_row = np.searchsorted(row_maxes, text_y2, side="left")
+        last_fitting_row = np.searchsorted(row_mins, text_y1, side="right") - 1
+        is_assigned = first_fitting_row <= last_fitting_row
+        row_indexes = first_fitting_row
+    else: #Lines out of order. Check every box against every row
+        fits = (text_y2[:, None] <= row_maxes[None, :]) & (text_y1[:, None] >= row_mins[None, :])
+        is_assigned = fits.any(axis=1)
+        row_indexes = fits.argmax(axis=1)
+
+    if is_assigned.all():
+        text_boxes["row"] = row_indexes
+    else: #Not sure this part is ever called
+        text_boxes["row"] = np.where(is_assigned, row_indexes, np.nan)
   
     return text_boxes
     
 def assign_columns(vert_lines, text_boxes):
-    column_ranges = list()
-    for index, vert_line in enumerate(vert_lines[:len(vert_lines) - 1]):
-        x1, y1, x2, y2 = tuple(vert_line)
-        column_ranges.append((x1, vert_lines[index + 1][0]))
-    left_values = text_boxes["x2"].values.tolist()
-    column_indexes = list()
-    for left in left_values:
-        was_appended = False
-        index = 0
-        for index, (min, max) in enumerate(column_ranges):
-            if left <= max:
-                column_indexes.append(index)
-                was_appended = True
-                break
-        if not was_appended:
-            column_indexes.append(index)
-    text_boxes["column"] = column_indexes
-    return text_boxes
\ No newline at end of file
+    '''Assigns each text box the first column whose right edge (the next vertical line) isn't left
+    of the box's right edge. Boxes right of every column fall through to the last column
+    '''
+    vert_lines = np.asarray(vert_lines, dtype=np.int64).reshape(-1, 4)
+    column_maxes = vert_lines[1:, 0]
+    text_x2 = text_boxes["x2"].to_numpy()
+
+    if _is_sorted(column_maxes):
+        column_indexes = np.searchsorted(column_maxes, text_x2, side="left")
+    else: #Lines out of order. Check every box against every column
+        fits = text_x2[:, None] <= column_maxes[None, :]
+        column_indexes = np.where(fits.any(axis=1), fits.argmax(axis=1), len(column_maxes))
+
+    text_boxes["column"] = np.minimum(column_indexes, max(len(column_maxes) - 1, 0))
+    return text_boxes
+
+def _is_sorted(values):
+    return bool(np.all(values[1:] >= values[:-1]))
@@ -3,13 +3,25 @@ import pandas as pd
 import cv2
 import pytesseract
 
+from ocirs import ocr_cache
+from ocirs.ocr_backends import get_ocr_backend
+from ocirs.table_extraction.borderless_table_extraction import get_text_boxes
 
-def get_bordered_table_TDS(image, ocr_dataframe=None):
+
+#Batched cell ocr stacks cell images onto tall canvases, CELL_CANVAS_GAP white pixels apart. A
+# canvas holds cells up to MAX_CELL_CANVAS_HEIGHT pixels, so large tables take a few canvases
+CELL_CANVAS_GAP = 20
+MAX_CELL_CANVAS_HEIGHT = 8000
+
+def get_bordered_table_TDS(image, ocr_dataframe=None, batched=False):
     '''
-    NOTE: Still need to figure out how to leverage pre-computed ocr_dataframe
     Drawn from this Towards Data Science Post
     https://towardsdatascience.com/a-table-detection-cell-recognition-and-text-extraction-algorithm-to-convert-tables-to-excel-files-902edcf289ec
 
+    Cells are found from the table's ruling lines. If an ocr_dataframe of the image is passed, each
+    of its words is placed in the cell containing the word's centre. Otherwise every cell is ocr'd
+    on its own, or with `batched=True` together with the other cells in a few tesseract calls (see
+    `get_box_texts_from_ocr()`)
     '''
 
     #inverting the image
@@ -51,37 +63,13 @@ def get_bordered_table_TDS(image, ocr_dataframe=None):
     img_vh = cv2.addWeighted(vertical_lines, 0.5, horizontal_lines, 0.5, 0.0)
 
 
-    #Identify boundaries of table 
-     # cv2.line(img,(x1,y1),(x2,y2),(0,255,0),2)
-    min_y = horizontal_lines.shape[0]
-    max_y = 0
-    min_x = img_vh.shape[1]
-    max_x = 0
-    for y_index,pixel_row in enumerate(horizontal_lines):
-        for x_index, pixel in enumerate(pixel_row):
-            if pixel == 255:
-
-                if y_index < min_y: 
-                    min_y = y_index
-                if y_index > max_y:
-                    max_y = y_index
-                if x_index < min_x:
-                    min_x = x_index
-                if x_index > max_x:
-                    max_x = x_index
-
-    for y_index,pixel_row in enumerate(vertical_lines):
-        for x_index, pixel in enumerate(pixel_row):
-            if pixel == 255:
-
-                if y_index < min_y: 
-                    min_y = y_index
-                if y_index > max_y:
-                    max_y = y_index
-                if x_index < min_x:
-                    min_x = x_index
-                if x_index > max_x:
-                    max_x = x_index
+    #Identify boundaries of table: the bounding box of every pixel on either line mask
+    line_mask = ((horizontal_lines == 255) | (vertical_lines == 255)).astype(np.uint8)
+    x, y, w, h = cv2.boundingRect(line_mask)
+    if w > 0: 
+        min_x, min_y, max_x, max_y = x, y, x + w - 1, y + h - 1
+    else: #No lines found
+        min_x, min_y, max_x, max_y = img_vh.shape[1], horizontal_lines.shape[0], 0, 0
 
     # #Crop image to the edges of the table
     # img_vh = img_vh[min_y:max_y, min_x:max_x]
@@ -122,7 +110,6 @@ def get_bordered_table_TDS(image, ocr_dataframe=None):
     for c in contours:
         x, y, w, h = cv2.boundingRect(c)    
         if (w<1000 and h<500): #WE MAY NEED TO ADJUST THESE VALUES TO BETTER DETECT CELLS. Values are for the max height and width of a certain cells. Avoids detecting a large box that is not really a cell
-            image = cv2.rectangle(image,(x,y),(x+w,y+h),(0,255,0),2)
             box.append([x,y,w,h])
        
 
@@ -174,37 +161,19 @@ def get_bordered_table_TDS(image, ocr_dataframe=None):
         finalboxes.append(lis)
 
 
-    #from every single image-based cell/box the strings are extracted via pytesseract and stored in a list
-    # print(finalboxes)
-    #Need to combine final boxes with ocr_dataframe
-    # Think what you have to do is iterate through finalboxes and leverage the [y,x,w,h] value of each "box".
-    # Compare the values to whats available to ocr_dataframe
-
+    #Text of every cell/box, either from the ocr_dataframe or extracted via pytesseract
+    if ocr_dataframe is not None:
+        box_texts = get_box_texts_from_ocr_dataframe(box, image, ocr_dataframe)
+    else:
+        box_texts = get_box_texts_from_ocr(box, bitnot, batched)
 
     outer=[]
     for i in range(len(finalboxes)):
         for j in range(len(finalboxes[i])):
-            inner=''
-            # print(finalboxes[i][j])
             if(len(finalboxes[i][j])==0):
                 outer.append(' ')        
             else:
-                for k in range(len(finalboxes[i][j])):
-                    y,x,w,h = finalboxes[i][j][k][0],finalboxes[i][j][k][1], finalboxes[i][j][k][2],finalboxes[i][j][k][3]
-
-                    #Table cell by table cell pre-processing before pytesseract
-                    finalimg = bitnot[x:x+h, y:y+w] #Crop the big image to just the small box denoted by one of the final boxes
-                    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 1))
-                    border = cv2.copyMakeBorder(finalimg,2,2,2,2,   cv2.BORDER_CONSTANT,value=[255,255])
-                    resizing = cv2.resize(border, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-                    dilation = cv2.dilate(resizing, kernel,iterations=1)
-                    erosion = cv2.erode(dilation, kernel,iterations=1)
-
-                    
-                    out = pytesseract.image_to_string(erosion)
-                    if(len(out)==0):
-                        out = pytesseract.image_to_string(erosion, config='--psm 3')
-                    inner = inner +" "+ out            
+                inner = " ".join(box_texts[tuple(cell_box)] for cell_box in finalboxes[i][j])
                 outer.append(inner.strip())
 
     #Creating a dataframe of the generated OCR list
@@ -216,6 +185,164 @@ def get_bordered_table_TDS(image, ocr_dataframe=None):
 
 
 
+def get_box_texts_from_ocr_dataframe(boxes, image, ocr_dataframe):
+    '''Joins the words of an ocr dataframe into the text of the cell boxes containing them
+
+    Each word belongs to the smallest box containing its centre, and a box's words are joined in
+    ocr reading order. Words outside every box are dropped
+
+    :param boxes: cell boxes as [x, y, w, h] lists
+    :type boxes: list
+    :param image: table image the ocr dataframe was computed from
+    :type image: numpy.ndarray
+    :param ocr_dataframe: pytesseract.image_to_data() dataframe of the image
+    :type ocr_dataframe: pandas.DataFrame
+
+    :returns: dict of (x, y, w, h): cell text
+    :rtype: dict
+    '''
+    box_texts = {tuple(cell_box): "" for cell_box in boxes}
+    text_boxes = get_text_boxes(image, ocr_dataframe)
+    if not boxes or text_boxes.empty:
+        return box_texts
+
+    x, y, w, h = np.array(boxes, dtype=np.int64).T
+    x_middles, y_middles = text_boxes["x_middle"].to_numpy(), text_boxes["y_middle"].to_numpy()
+
+    #Boxes (rows) containing each word's centre (columns). Nested boxes can both contain a word,
+    # so words go to the smallest one
+    contains_word = ((x_middles >= x[:, None]) & (x_middles < (x + w)[:, None])
+                        & (y_middles >= y[:, None]) & (y_middles < (y + h)[:, None]))
+    box_areas = np.where(contains_word, (w * h)[:, None], np.iinfo(np.int64).max)
+    word_boxes = box_areas.argmin(axis=0)
+    in_a_box = contains_word.any(axis=0)
+
+    joined_texts = text_boxes["text"][in_a_box].groupby(word_boxes[in_a_box], sort=False).agg(" ".join)
+    for box_index, text in joined_texts.items():
+        box_texts[tuple(boxes[box_index])] = text
+
+    return box_texts
+
+def get_box_texts_from_ocr(boxes, bitnot, batched=False):
+    '''Ocr's the cell boxes of a table image
+
+    Cells are cropped from the table image and preprocessed (padded, upscaled 2x and cleaned up)
+    one by one. By default every cell is then ocr'd with its own tesseract call, and a second one
+    (--psm 3) when the first finds nothing.
+
+    `batched=True` ocr's the cells together with a few tesseract calls instead (see
+    `ocr_cell_images_batch()`). Cells where no text is found are tried once more, again as a
+    batch, with full page segmentation (--psm 3). This is much faster, but text can differ from
+    per cell ocr: cells are read as single blocks of text (--psm 6), a cell's words are joined
+    with spaces and words can be read across neighbouring cells on the canvas. It has not been
+    checked against per cell ocr with real tesseract, so it's opt in
+
+    :param boxes: cell boxes as [x, y, w, h] lists
+    :type boxes: list
+    :param bitnot: table image with its ruling lines removed
+    :type bitnot: numpy.ndarray
+    :param batched: whether to ocr all cells in a few batched calls. Default False
+    :type batched: bool
+
+    :returns: dict of (x, y, w, h): cell text
+    :rtype: dict
+    '''
+    cell_images = [preprocess_cell_image(bitnot, cell_box) for cell_box in boxes]
+
+    if batched:
+        cell_texts = ocr_cell_images_batch(cell_images, config="--psm 6")
+        empty_cells = [index for index, text in enumerate(cell_texts) if not text]
+        retried_texts = ocr_cell_images_batch([cell_images[index] for index in empty_cells], config="--psm 3")
+        for index, text in zip(empty_cells, retried_texts):
+            cell_texts[index] = text
+    else:
+        ocr_backend = get_ocr_backend()
+        cell_texts = []
+        for cell_image in cell_images:
+            out = ocr_backend.image_to_string(cell_image)
+            if(len(out)==0):
+                out = ocr_backend.image_to_string(cell_image, config='--psm 3')
+            cell_texts.append(out)
+
+    return {tuple(cell_box): text for cell_box, text in zip(boxes, cell_texts)}
+
+def preprocess_cell_image(bitnot, cell_box):
+    '''Crops one cell box from a table image and prepares it for ocr
+
+    :returns: cell image
+    :rtype: numpy.ndarray
+    '''
+    y,x,w,h = cell_box[0],cell_box[1], cell_box[2],cell_box[3]
+
+    #Table cell by table cell pre-processing before pytesseract
+    finalimg = bitnot[x:x+h, y:y+w] #Crop the big image to just the small box denoted by one of the final boxes
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 1))
+    border = cv2.copyMakeBorder(finalimg,2,2,2,2,   cv2.BORDER_CONSTANT,value=[255,255])
+    resizing = cv2.resize(border, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    dilation = cv2.dilate(resizing, kernel,iterations=1)
+    erosion = cv2.erode(dilation, kernel,iterations=1)
+
+    return erosion
+
+def ocr_cell_images_batch(cell_images, config="--psm 6"):
+    '''Ocr's many cell images with one tesseract call per canvas
+
+    Cell images are stacked top to bottom on white canvases, CELL_CANVAS_GAP pixels apart, and
+    each canvas is ocr'd once (through the ocr cache). Every word found is given back to the cell
+    whose rows contain the word's vertical middle, and a cell's words are joined in ocr reading
+    order
+
+    :param cell_images: greyscale cell images
+    :type cell_images: list
+    :param config: tesseract config for the canvas ocr. Default "--psm 6", a single block of text
+    :type config: string
+
+    :returns: text of each cell image, "" if none was found
+    :rtype: list
+    '''
+    cell_texts = [""] * len(cell_images)
+
+    canvas_start = 0
+    while canvas_start < len(cell_images):
+        ###############################
+        # Fill a canvas with as many cells as fit, and always at least one
+        ###############################
+        cell_tops = []
+        canvas_height = CELL_CANVAS_GAP
+        canvas_end = canvas_start
+        while canvas_end < len(cell_images) and (canvas_end == canvas_start or
+                canvas_height + cell_images[canvas_end].shape[0] + CELL_CANVAS_GAP <= MAX_CELL_CANVAS_HEIGHT):
+            cell_tops.append(canvas_height)
+            canvas_height += cell_images[canvas_end].shape[0] + CELL_CANVAS_GAP
+            canvas_end += 1
+
+        canvas_cells = cell_images[canvas_start:canvas_end]
+        canvas_width = max(cell_image.shape[1] for cell_image in canvas_cells) + 2*CELL_CANVAS_GAP
+        canvas = np.full((canvas_height, canvas_width), 255, dtype=np.uint8)
+        for cell_image, cell_top in zip(canvas_cells, cell_tops):
+            canvas[cell_top:cell_top + cell_image.shape[0], CELL_CANVAS_GAP:CELL_CANVAS_GAP + cell_image.shape[1]] = cell_image
+
+        ###############################
+        # Ocr the canvas and map words back to cells by their vertical middle
+        ###############################
+        ocr_data = ocr_cache.image_to_data(canvas, config=config, output_type=pytesseract.Output.DICT)
+        text = np.array([str(word).strip() for word in ocr_data["text"]], dtype=object)
+        is_word = text != ""
+        y_middles = (np.asarray(ocr_data["top"]) + np.asarray(ocr_data["height"])//2)[is_word]
+
+        cell_tops = np.array(cell_tops)
+        cell_bottoms = cell_tops + np.array([cell_image.shape[0] for cell_image in canvas_cells])
+        word_cells = np.searchsorted(cell_tops, y_middles, side="right") - 1
+        in_a_cell = (word_cells >= 0) & (y_middles < cell_bottoms[word_cells.clip(0)])
+
+        joined_texts = pd.Series(text[is_word][in_a_cell]).groupby(word_cells[in_a_cell], sort=False).agg(" ".join)
+        for cell_index, cell_text in joined_texts.items():
+            cell_texts[canvas_start + cell_index] = cell_text
+
+        canvas_start = canvas_end
+
+    return cell_texts
+
 def sort_contours(cnts, method="left-to-right"):
     
     # initialize the reverse flag and sort index
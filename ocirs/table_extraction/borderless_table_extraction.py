@@ -1,6 +1,7 @@
+import numpy as np
 import pandas as pd
 import pytesseract
-from scipy.cluster.hierarchy import fclusterdata
+from ocirs import ocr_cache
 from ocirs.table_extraction.line_detector.line_detector import LineDetector
 
 def get_borderless_table(image, ocr_dataframe=None):
@@ -15,12 +16,18 @@ def get_borderless_table(image, ocr_dataframe=None):
 
 
 def get_text_boxes(image, ocr_dataframe):
+    '''Returns a dataframe of the confidently recognised, non-blank words in an image
+
+    Columns are `left`, `top`, `width`, `height`, `text` and the derived `y_middle`, `y2`,
+    `x_middle` and `x2`, all integer but `text`. Built column by column from numpy arrays, without
+    copying the whole ocr dataframe
+    '''
 
     OCR_TEXT_CONFIDENCE_THRESHOLD = 0.6 
 
     if ocr_dataframe is None:
         #If ocr_dataframe is not passed, will have to create the text box dataframe from scratch using pytesseract
-        boxes = pytesseract.image_to_data(
+        boxes = ocr_cache.image_to_data(
             image, 
             output_type=pytesseract.Output.DICT,
             config=f"--oem 3 --psm 1"
@@ -29,24 +36,32 @@ def get_text_boxes(image, ocr_dataframe):
     
     else:
  
-        boxes = ocr_dataframe.copy()
-
-    boxes["conf"] = boxes["conf"].apply(lambda x: int(x))
-    boxes = boxes[boxes.conf > OCR_TEXT_CONFIDENCE_THRESHOLD]
-    boxes['text'] = boxes["text"].apply(lambda x: x.strip())
-    boxes = boxes[boxes.text != ""]
-    boxes.drop(["level", "page_num", "block_num", "par_num", "line_num", "word_num", "conf"], 
-        axis=1, 
-        inplace=True
-    )
-    boxes = boxes.reset_index(drop=True)
-
-
-    if not boxes.empty:
-        boxes["y_middle"] = boxes.apply(lambda row: row.top + int(row.height/2), axis=1)
-        boxes["y2"] = boxes.apply(lambda row: row.top + row.height, axis=1)
-        boxes["x_middle"] = boxes.apply(lambda row: row.left + int(row.width/2) , axis=1)
-        boxes["x2"] = boxes.apply(lambda row: row.left + row.width, axis=1)
+        boxes = ocr_dataframe
+
+    ###############################
+    # Keep words whose (truncated) confidence passes the threshold and whose text isn't blank
+    ###############################
+    conf = np.trunc(pd.to_numeric(boxes["conf"]).to_numpy(dtype=np.float64))
+    confident = np.flatnonzero(conf > OCR_TEXT_CONFIDENCE_THRESHOLD)
+
+    text = boxes["text"].iloc[confident].fillna("").astype(str).str.strip().to_numpy(dtype=object)
+    word_rows = confident[text != ""]
+    text = text[text != ""]
+
+    left, top, width, height = (boxes[column].to_numpy()[word_rows].astype(np.int64)
+                                for column in ("left", "top", "width", "height"))
+
+    boxes = pd.DataFrame({
+        "left": left,
+        "top": top,
+        "width": width,
+        "height": height,
+        "text": text,
+        "y_middle": top + height // 2,
+        "y2": top + height,
+        "x_middle": left + width // 2,
+        "x2": left + width
+    })
 
     return boxes
 
@@ -70,77 +85,103 @@ def assign_columns(text_boxes):
 
 
 def get_clustering_indexes(list_data, max_distance):
-    clusters = fclusterdata(list_data, t=max_distance, criterion='distance')
-    clusters_with_list_data = dict()
-    for index, cluster_number in enumerate(clusters):
-        if not clusters_with_list_data.get(cluster_number):
-            clusters_with_list_data[cluster_number] = list()
-        clusters_with_list_data[cluster_number].append(list_data[index])
-    clusters_to_indexes = dict()
-    for index, (key, value) in enumerate(clusters_with_list_data.items()):
-        clusters_to_indexes[key] = index
-    indexes = [
-        clusters_to_indexes[cluster_number] for cluster_number in clusters
-    ]
-    return indexes
+    '''Clusters one dimensional values, joining values that are at most `max_distance` apart
+
+    Gives the same clusters as single linkage hierarchical clustering cut at `max_distance`
+    (`scipy.cluster.hierarchy.fclusterdata(list_data, t=max_distance, criterion='distance')`). In
+    one dimension those are the runs of sorted values with no gap wider than `max_distance`, so
+    sorting and splitting on wide gaps finds them in O(n log n) time and O(n) memory.
+
+    Clusters are numbered from 0 in order of their first value in `list_data`
+
+    :param list_data: values to cluster, as a flat array or an (n, 1) array
+    :type list_data: numpy array
+    :param max_distance: largest gap within a cluster
+    :type max_distance: int
+
+    :returns: cluster index of each value
+    :rtype: list
+    '''
+    values = np.asarray(list_data, dtype=np.float64).ravel()
+    if len(values) == 0:
+        return []
+
+    ###############################
+    # Sort, then start a new cluster after every gap wider than max_distance
+    ###############################
+    order = np.argsort(values, kind="stable")
+    gaps = np.diff(values[order])
+    sorted_clusters = np.concatenate(([0], np.cumsum(gaps > max_distance)))
+    clusters = np.empty(len(values), dtype=np.int64)
+    clusters[order] = sorted_clusters
+
+    ###############################
+    # Renumber clusters in order of first appearance
+    ###############################
+    _, first_indexes = np.unique(clusters, return_index=True)
+    cluster_numbers = np.empty(len(first_indexes), dtype=np.int64)
+    cluster_numbers[np.argsort(first_indexes)] = np.arange(len(first_indexes))
+
+    return cluster_numbers[clusters].tolist()
 
 def split_columns_on_vert_lines(image, text_boxes):
+    '''Splits clustered columns that a vertical line runs through
+
+    A vertical line at x splits a column when it lies in (column's left, column's right]. Boxes in
+    that column whose right edge is at or right of x move into a new column to the right. Each
+    box's number of splitting lines is counted with `np.searchsorted` over the sorted line x
+    positions, then columns are renumbered so they stay consecutive and in order
+    '''
     line_detector = LineDetector()
     _, vert_lines = line_detector.detect_lines(image, text_boxes, "vertical")
-    text_boxes_columns = [x for _, x in text_boxes.groupby("column")]
-    for no, (x1, y1, x2, y2) in enumerate(vert_lines):
-        for df_index, df in enumerate(text_boxes_columns):
-            left = df["left"].min()
-            right = df["x2"].max()
-            if x1 > left and x1 <= right:
-                for row_index, row in df.iterrows():
-                    # if textbox is on right side of this line, then
-                    # this textbox should be placed one column further (left to right)
-                    if row.x2 >= x1:
-                        text_boxes.loc['column', row.name] = row["column"] + no + 1
+    if text_boxes.empty or len(vert_lines) == 0:
+        return text_boxes
+
+    line_xs = np.sort(np.asarray(vert_lines).reshape(-1, 4)[:, 0])
+    columns = text_boxes["column"].to_numpy(dtype=np.int64)
+    column_lefts = text_boxes.groupby("column")["left"].transform("min").to_numpy()
+
+    #Lines with column left < x <= box right edge. A box's right edge never passes its column's right
+    split_counts = (np.searchsorted(line_xs, text_boxes["x2"].to_numpy(), side="right")
+                    - np.searchsorted(line_xs, column_lefts, side="right"))
+    split_counts = np.maximum(split_counts, 0)
+
+    #Number (column, split count) pairs consecutively, ordered by column then split count
+    _, text_boxes["column"] = np.unique(columns * (split_counts.max() + 1) + split_counts,
+                                        return_inverse=True)
     return text_boxes
 
 def text_boxes_to_table(text_boxes):
+    '''Lays out aggregated text boxes as a table. The first row becomes the column headers
+
+    Each cell's text is scattered straight into a preallocated row x column grid, so this is
+    linear in the number of text boxes
+    '''
     text_boxes = aggregate_text_boxes(text_boxes)
     amount_rows = int(text_boxes["row"].max()) + 1
     amount_columns = int(text_boxes["column"].max()) + 1
     
-    data = list()
-    for i in range(amount_rows):
-        row = list()
-        for j in range(amount_columns):
-            result = text_boxes.loc[
-                (text_boxes["row"] == i) & 
-                (text_boxes["column"] == j)
-            ]
-            if result.empty:
-                row.append(None)
-            else:
-                row.append(result["text"].iloc[0].strip())
-        data.append(row)
-    table = pd.DataFrame(data=data[1:], columns=data[0])
+    data = np.full((amount_rows, amount_columns), None, dtype=object)
+    data[text_boxes["row"].to_numpy(dtype=np.int64),
+            text_boxes["column"].to_numpy(dtype=np.int64)] = text_boxes["text"].str.strip().to_numpy(dtype=object)
+    table = pd.DataFrame(data=data[1:].tolist(), columns=data[0].tolist())
     # table = table.dropna(axis=1, how='all')
     # table = table.dropna(axis=0, how='all')
     return table
 
 def aggregate_text_boxes(text_boxes):
-    grouped = [x for _, x in text_boxes.groupby(["column", "row"])]
-    data = list()
-    for df in grouped:
-        df = df.reset_index(drop=True)
-        left = df["left"][0]
-        top = df["top"].min()
-        width = df["width"].sum()
-        height = df["height"].max()
-        text = ""
-        column = df["column"][0]
-        row = df["row"][0]
-        for index, element in df.iterrows():
-            text += (" " + element["text"])
-        data.append([left, top, width, height, text, row, column])
-    # columns = df.columns.values.tolist()
-    text_boxes_aggregated = pd.DataFrame(
-        data=data,
-        columns=["left", "top", "width", "height", "text", "row", "column"]
-    )
-    return text_boxes_aggregated
\ No newline at end of file
+    '''Merges the text boxes of each cell (column, row) into one box, in a single grouped pass
+
+    Text is joined in reading order with a leading space before each word. Boxes are returned
+    sorted by column, then row
+    '''
+    text_boxes = text_boxes.assign(text=" " + text_boxes["text"])
+    text_boxes_aggregated = text_boxes.groupby(["column", "row"], sort=True).agg(
+        left=("left", "first"),
+        top=("top", "min"),
+        width=("width", "sum"),
+        height=("height", "max"),
+        text=("text", "".join)
+    ).reset_index()
+
+    return text_boxes_aggregated[["left", "top", "width", "height", "text", "row", "column"]]
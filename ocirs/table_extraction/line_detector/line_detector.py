@@ -3,6 +3,27 @@ import numpy as np
 import math
 from ocirs.table_extraction.line_detector.line_detection import line_detection
 class LineDetector:
+    '''Finds the horizontal and vertical ruling lines of a table image
+
+    Two line finding methods are available. Both work on a single edge map of the image, computed
+    once and shared by both line orientations:
+    * "hough" (default): probabilistic Hough transform
+    * "morphology": oriented morphological opening keeps only long horizontal or vertical edge
+    runs, and each connected component of those runs becomes one axis-aligned line. Faster, but
+    not yet validated against Hough on real scans, and it can find lines Hough doesn't, changing
+    extracted table shapes. Opt in with `LineDetector(method="morphology")`
+    '''
+
+    #Settings shared by both methods
+    EDGES_LOW_THRESHOLD = 20
+    MIN_LINE_LENGTH = 100  # minimum number of pixels making up a line
+    MAX_LINE_GAP = 20  # maximum gap in pixels between connectable line segments
+
+    def __init__(self, method="hough"):
+        if method not in ("morphology", "hough"):
+            raise ValueError(f"""method must be set to one of 'morphology' or 'hough'.
+                            Recieved '{method}'""")
+        self.method = method
 
     def detect_lines(self, image, text_boxes, line_type=None):
         image_2 = image.copy()
@@ -35,57 +56,124 @@ class LineDetector:
         ## To visualize image after thresholding ##
         # cv2.imshow("bw",image)
         # cv2.waitKey(0)
-        horiz_lines = list()
-        vert_lines = list()
+
+        #Edges are computed once and shared by both line orientations
+        kernel_size = 5
+        blur_gray = cv2.GaussianBlur(image,(kernel_size, kernel_size),0)
+        edges = cv2.Canny(blur_gray, self.EDGES_LOW_THRESHOLD, self.EDGES_LOW_THRESHOLD*3)
+
+        #Line strength threshold of each requested orientation. Hough votes, or for morphology the
+        # minimum length of a line's edge run
         if line_type is None:
-            horiz_lines = self._find_lines_of_type(image, "horizontal", 20, 150)
-            vert_lines = self._find_lines_of_type(image, "vertical", 20, 100)
+            thresholds = {"horizontal": 150, "vertical": 100}
+        elif line_type == "horizontal":
+            thresholds = {"horizontal": 150}
+        elif line_type == "vertical":
+            thresholds = {"vertical": 150}
         else:
-            if line_type == "horizontal":
-                horiz_lines = self._find_lines_of_type(image, "horizontal", 20, 150)
-            elif line_type == "vertical":
-                vert_lines = self._find_lines_of_type(image, "vertical", 20, 150)
-        return horiz_lines, vert_lines
+            thresholds = {}
+
+        if self.method == "morphology":
+            lines = self._find_axis_lines(edges, thresholds)
+        else:
+            lines = {type: self._find_lines_of_type(edges, type, threshold)
+                        for type, threshold in thresholds.items()}
+
+        no_lines = np.empty((0, 4), dtype=int)
+        return lines.get("horizontal", no_lines), lines.get("vertical", no_lines)
+
+    def _find_axis_lines(self, edges, thresholds):
+        '''Finds horizontal and vertical lines in an edge map with morphology
+
+        For each orientation, edges are dilated (thickened across the line direction so slightly
+        skewed lines still form unbroken runs, and stretched along it to bridge gaps up to
+        MAX_LINE_GAP), then eroded with a line shaped kernel, which erases every run shorter than
+        the orientation's threshold. That is a closing followed by an opening, merged into one
+        dilation and one erosion, with the opening's final dilation left out: it is added back to
+        each remaining run's bounding box instead. Each run left is one line, placed across the
+        middle of its bounding box.
+
+        :returns: dict of orientation: (N, 4) array of x1, y1, x2, y2 lines, sorted by position
+        :rtype: dict
+        '''
+        lines = dict()
+        for type, threshold in thresholds.items():
+            min_length = max(threshold, self.MIN_LINE_LENGTH)
+            dilate_length, erode_length = self.MAX_LINE_GAP + 1, self.MAX_LINE_GAP + min_length
+            if type == "horizontal":
+                dilate_kernel, erode_kernel = (dilate_length, 3), (erode_length, 1)
+            else:
+                dilate_kernel, erode_kernel = (3, dilate_length), (1, erode_length)
+
+            line_image = cv2.dilate(edges, cv2.getStructuringElement(cv2.MORPH_RECT, dilate_kernel))
+            line_image = cv2.erode(line_image, cv2.getStructuringElement(cv2.MORPH_RECT, erode_kernel))
+
+            #Kernels are anchored at their centre, so the dilation grew each run by dilate_length//2
+            # pixels at both ends and the erosion then trimmed erode_length//2 from its start and
+            # the rest of erode_length - 1 from its end
+            start_offset = erode_length//2 - dilate_length//2
+            end_offset = (erode_length - 1 - erode_length//2) - dilate_length//2
+            #(Runs touching the image border extend past it, as the erosion treats outside pixels as set)
+            height, width = edges.shape[:2]
+            contours, _ = cv2.findContours(line_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            x, y, w, h = np.array([cv2.boundingRect(contour) for contour in contours], dtype=int).reshape(-1, 4).T
+            if type == "horizontal":
+                found_lines = np.column_stack((np.maximum(x - start_offset, 0), y + h//2,
+                                                np.minimum(x + w - 1 + end_offset, width - 1), y + h//2))
+                lines[type] = found_lines[np.argsort(found_lines[:, 1], kind="stable")]
+            else:
+                found_lines = np.column_stack((x + w//2, np.maximum(y - start_offset, 0),
+                                                x + w//2, np.minimum(y + h - 1 + end_offset, height - 1)))
+                lines[type] = found_lines[np.argsort(found_lines[:, 0], kind="stable")]
+
+        return lines
 
     def _remove_detected_text_from_image(self, image, text_boxes):
         if text_boxes.empty:
             return image
-        image_text_boxes_removed = image.copy()
+        height, width = image.shape[:2]
         # text_boxes.to_csv("test_boxes_local.csv", index=False)
-        for index, row in text_boxes.iterrows():
-            
-            #Prevent rectangle mask bounds from extending outside the boundary of image
-            left = row["left"]-2 if row["left"]-2 > 0 else row["left"]
-            top = row['top']-2 if row['top']-2 > 0 else row['top']  
-            right = row['x2']+2 if row['x2']+2 < image_text_boxes_removed.shape[1] else row['x2']
-            bottom = row['y2']+2 if row['y2']+2 < image_text_boxes_removed.shape[0] else row['y2']
-            
-            # Pytesseract occasionally messes up and declares a piece of text thats extends across 
-            # the entire image. 
-            # These two if statements will detect that, and will skip over drawing a rectangle mask
-            # for those erroneous boundaries
-            if right-left == image_text_boxes_removed.shape[1]:
-                continue
-            if bottom-top == image_text_boxes_removed.shape[0]:
-                continue
-
-            cv2.rectangle(
-                image_text_boxes_removed, 
-                (left, top), 
-                (right, bottom), 
-                (255, 255, 255), -1)
-        return image_text_boxes_removed
 
-    def _find_lines_of_type(self, image, type, edges_low_threshold, threshold_hough_lines):
-        kernel_size = 5
-        blur_gray = cv2.GaussianBlur(image,(kernel_size, kernel_size),0)
-        edges = cv2.Canny(blur_gray, edges_low_threshold, edges_low_threshold*3)
+        #Pad each text box by 2 pixels, unless that takes it past the boundary of image
+        left = text_boxes["left"].to_numpy(dtype=np.int64)
+        top = text_boxes["top"].to_numpy(dtype=np.int64)
+        right = text_boxes["x2"].to_numpy(dtype=np.int64)
+        bottom = text_boxes["y2"].to_numpy(dtype=np.int64)
+        left = np.where(left - 2 > 0, left - 2, left)
+        top = np.where(top - 2 > 0, top - 2, top)
+        right = np.where(right + 2 < width, right + 2, right)
+        bottom = np.where(bottom + 2 < height, bottom + 2, bottom)
+
+        # Pytesseract occasionally messes up and declares a piece of text thats extends across 
+        # the entire image. 
+        # Skip drawing a mask for those erroneous boundaries
+        is_masked = (right - left != width) & (bottom - top != height)
+
+        #Masks cover pixels from (left, top) to (right, bottom) inclusive, clipped to the image
+        left, right = np.clip(left, 0, width), np.clip(right, -1, width - 1)
+        top, bottom = np.clip(top, 0, height), np.clip(bottom, -1, height - 1)
+        is_masked &= (left <= right) & (top <= bottom)
+        left, top, right, bottom = left[is_masked], top[is_masked], right[is_masked], bottom[is_masked]
+
+        ###############################
+        # Paint every mask at once. Mark each rectangle's corners in a difference array, then its
+        # summed-area table (cv2.integral) gives the number of masks covering each pixel. Counts
+        # are small integers, so float32 holds them exactly
+        ###############################
+        coverage = np.zeros((height + 1, width + 1), dtype=np.float32)
+        np.add.at(coverage, (top, left), 1)
+        np.add.at(coverage, (top, right + 1), -1)
+        np.add.at(coverage, (bottom + 1, left), -1)
+        np.add.at(coverage, (bottom + 1, right + 1), 1)
+        coverage = cv2.integral(coverage[:height, :width], sdepth=cv2.CV_32F)[1:, 1:]
+
+        text_mask = cv2.compare(coverage, 0.5, cv2.CMP_GT) #255 where covered, else 0
+        image_text_boxes_removed = cv2.bitwise_or(image, text_mask)
+        return image_text_boxes_removed
 
+    def _find_lines_of_type(self, edges, type, threshold_hough_lines):
         rho = 1  # distance resolution in pixels of the Hough grid
         theta = np.pi / 180  # angular resolution in radians of the Hough grid
-        min_line_length = 100  # minimum number of pixels making up a line
-        max_line_gap = 20  # maximum gap in pixels between connectable line segments
-        line_image = np.copy(image) * 0  # creating a blank to draw lines on
 
         # Run Hough on edge detected image
         # Output "lines" is an array containing endpoints of detected line segments
@@ -93,45 +181,37 @@ class LineDetector:
                                 rho, 
                                 theta=theta, 
                                 threshold=threshold_hough_lines, 
-                                minLineLength=min_line_length,
-                                maxLineGap=max_line_gap)
+                                minLineLength=self.MIN_LINE_LENGTH,
+                                maxLineGap=self.MAX_LINE_GAP)
 
         if lines is None:
-            return list()
-
-        filtered_lines = list()
+            return np.empty((0, 4), dtype=int)
+        lines = lines.reshape(-1, 4).astype(int) #Some OpenCV versions drop the middle axis
 
-        t5 = math.tan(5*math.pi/180)
         t60 = math.sqrt(3)/2
 
+        #t60 is sin(60 degrees), used as a slope: dy/dx of sqrt(3)/2 is about 41 degrees from
+        # horizontal. Segments at least that steep, or exactly vertical, count as vertical
+        dx = np.abs(lines[:, 2] - lines[:, 0])
+        dy = np.abs(lines[:, 3] - lines[:, 1])
+        is_horizontal = (dx != 0) & (dy / np.maximum(dx, 1) < t60)
+
         if type == "horizontal":
-            for line in lines:
-                x1, y1, x2, y2 = tuple(line[0])
-                dx = abs(x2 - x1)
-                dy = abs(y2 - y1)
-                if dx != 0 and abs(dy/dx) < t60:
-                    filtered_lines.append((x1, y1, x2, y2))
-            filtered_lines = sorted(filtered_lines, key=lambda tup: tup[1])
+            filtered_lines = lines[is_horizontal]
+            filtered_lines = filtered_lines[np.argsort(filtered_lines[:, 1], kind="stable")]
         elif type == "vertical":
-            for line in lines:
-                x1, y1, x2, y2 = tuple(line[0])
-                dx = abs(x2 - x1)
-                dy = abs(y2 - y1)
-                if not (dx != 0 and abs(dy/dx) < t60):
-                    filtered_lines.append((x1, y1, x2, y2))
-            filtered_lines = sorted(filtered_lines, key=lambda tup: tup[0])
+            filtered_lines = lines[~is_horizontal]
+            filtered_lines = filtered_lines[np.argsort(filtered_lines[:, 0], kind="stable")]
         return filtered_lines
 
     def _remove_lines_on_text(self, horiz_lines, vert_lines, text_boxes):
         if text_boxes.empty:
             return horiz_lines, vert_lines
-        filtered_horiz_lines = list()
-        horiz_lines_to_remove = list()
-        for x1, y1, x2, y2 in horiz_lines:
-            text_boxes_with_line_on = text_boxes.loc[(text_boxes["y_middle"] - 4 < y1) & (text_boxes["y_middle"] + 4 > y1)]
-            if text_boxes_with_line_on.empty:
-                filtered_horiz_lines.append((x1, y1, x2, y2))
-        return filtered_horiz_lines, vert_lines
+        #Drop horizontal lines within 4 pixels of a text box's vertical middle
+        y_middles = np.sort(text_boxes["y_middle"].to_numpy())
+        band_starts = np.searchsorted(y_middles, horiz_lines[:, 1] - 4, side="right")
+        band_ends = np.searchsorted(y_middles, horiz_lines[:, 1] + 4, side="left")
+        return horiz_lines[band_starts >= band_ends], vert_lines
 
     def _add_border_lines(self, horiz_lines, vert_lines, text_boxes):
         if text_boxes.empty:
@@ -163,104 +243,93 @@ class LineDetector:
         #         horiz_lines.append(new_horiz_line)
 
         if len(vert_lines) > 0:
+            lefts, x2s = text_boxes["left"].to_numpy(), text_boxes["x2"].to_numpy()
+
             # first vertical line
             first_vert_line = vert_lines[0]
-            x1_first_vert_line = first_vert_line[0]
-            first_column_text_boxes = text_boxes.loc[text_boxes["x2"] < x1_first_vert_line]
-            if not first_column_text_boxes.empty:
-                x1 = first_column_text_boxes["left"].min() - padding_between_words_and_line
-                y1 = first_vert_line[1]
-                x2 = x1
-                y2 = first_vert_line[3]
-                new_vert_line = (x1, y1, x2, y2)
-                vert_lines.insert(0, new_vert_line)
+            first_column_lefts = lefts[x2s < first_vert_line[0]]
+            if len(first_column_lefts) > 0:
+                x1 = first_column_lefts.min() - padding_between_words_and_line
+                new_vert_line = (x1, first_vert_line[1], x1, first_vert_line[3])
+                vert_lines = np.vstack((new_vert_line, vert_lines))
 
             # last vertical line
             last_vert_line = vert_lines[-1]
-            x1_last_vert_line = last_vert_line[0]
-            last_column_text_boxes = text_boxes.loc[text_boxes["left"] > x1_last_vert_line]
-            if not last_column_text_boxes.empty:
-                x1 = last_column_text_boxes["x2"].max() + padding_between_words_and_line
-                y1 = last_vert_line[1]
-                x2 = x1
-                y2 = last_vert_line[3]
-                new_vert_line = (x1, y1, x2, y2)
-                vert_lines.append(new_vert_line)
+            last_column_x2s = x2s[lefts > last_vert_line[0]]
+            if len(last_column_x2s) > 0:
+                x1 = last_column_x2s.max() + padding_between_words_and_line
+                new_vert_line = (x1, last_vert_line[1], x1, last_vert_line[3])
+                vert_lines = np.vstack((vert_lines, new_vert_line))
 
         return horiz_lines, vert_lines
 
     def _extend_lines(self, horiz_lines, vert_lines):
-        all_lines = [*horiz_lines, *vert_lines]
-        if len(all_lines) > 0:
-            lowest_x1 = all_lines[0][0]
-            highest_x2 = all_lines[0][2]
-            lowest_y1 = all_lines[0][1]
-            highest_y2 = all_lines[0][3]
-            for x1, y1, x2, y2 in all_lines[1:]:
-                if x1 < lowest_x1:
-                    lowest_x1 = x1
-                if x2 > highest_x2:
-                    highest_x2 = x2
-                if y1 < lowest_y1:
-                    lowest_y1 = y1
-                if y2 > highest_y2:
-                    highest_y2 = y2
-
-        for index, (x1, y1, x2, y2) in enumerate(horiz_lines):
-            horiz_lines[index] = (lowest_x1, y1, highest_x2, y1)
-        for index, (x1, y1, x2, y2) in enumerate(vert_lines):
-            vert_lines[index] = (x1, lowest_y1, x1, highest_y2)
+        all_lines = np.vstack((horiz_lines, vert_lines))
+        if len(all_lines) == 0:
+            return horiz_lines, vert_lines
+
+        #Stretch every line across the bounding box of all lines
+        lowest_x1, lowest_y1 = all_lines[:, 0].min(), all_lines[:, 1].min()
+        highest_x2, highest_y2 = all_lines[:, 2].max(), all_lines[:, 3].max()
+
+        horiz_lines = horiz_lines.copy()
+        horiz_lines[:, 0], horiz_lines[:, 2], horiz_lines[:, 3] = lowest_x1, highest_x2, horiz_lines[:, 1]
+        vert_lines = vert_lines.copy()
+        vert_lines[:, 1], vert_lines[:, 2], vert_lines[:, 3] = lowest_y1, vert_lines[:, 0], highest_y2
 
         return horiz_lines, vert_lines
     
     def _merge_nearby_lines(self, horiz_lines, vert_lines, line_fusion_threshold_px=10):
-        horiz_lines_merged = horiz_lines
-        if len(horiz_lines_merged) > 0:
-            for i in range(10):
-                horiz_lines_merged_iteration = list()
-                horiz_line_index = 0
-                while horiz_line_index < (len(horiz_lines_merged) - 1):
-                    x1, y1, x2, y2 = horiz_lines_merged[horiz_line_index]
-                    x1_next, y1_next, x2_next, y2_next = horiz_lines_merged[horiz_line_index + 1]
-                    height_diff = y1_next - y1
-                    if height_diff < line_fusion_threshold_px:
-                        new_y = y1 + int(height_diff/2)
-                        horiz_lines_merged_iteration.append((x1, new_y, x2, new_y))
-                        horiz_line_index += 1
-                    else:
-                        horiz_lines_merged_iteration.append((x1, y1, x2, y2))
-                    horiz_line_index += 1
-                horiz_lines_merged_iteration.append(horiz_lines_merged[-1])
-                horiz_lines_merged = horiz_lines_merged_iteration
-
-        vert_lines_merged = vert_lines
-        if len(vert_lines_merged) > 0:
-            for i in range(10):
-                vert_lines_merged_iteration = list()
-                vert_line_index = 0
-                while vert_line_index < (len(vert_lines_merged) - 1):
-                    x1, y1, x2, y2 = vert_lines_merged[vert_line_index]
-                    x1_next, y1_next, x2_next, y2_next = vert_lines_merged[vert_line_index + 1]
-                    width_diff = x1_next - x1
-                    if width_diff < line_fusion_threshold_px:
-                        new_x = x1 + int(width_diff/2)
-                        vert_lines_merged_iteration.append((new_x, y1, new_x, y2))
-                        vert_line_index += 1
-                    else:
-                        vert_lines_merged_iteration.append((x1, y1, x2, y2))
-                    vert_line_index += 1
-                vert_lines_merged_iteration.append(vert_lines_merged[-1])
-                vert_lines_merged = vert_lines_merged_iteration
-
-        return horiz_lines_merged, vert_lines_merged
+        '''Merges pairs of neighbouring lines closer than line_fusion_threshold_px into single lines
+
+        Each pass walks the lines in position order and merges every line with the next one when
+        they're less than line_fusion_threshold_px apart, placing the merged line halfway between
+        them. A merged pair is skipped over, so a run of close lines is merged two at a time and
+        runs of evenly spaced lines keep their spacing instead of chaining into one line. Passes
+        repeat until no two neighbouring lines are closer than line_fusion_threshold_px.
+
+        :returns: horizontal and vertical lines as (N, 4) arrays of x1, y1, x2, y2, sorted by position
+        :rtype: tuple
+        '''
+        return (self._merge_lines_on_axis(horiz_lines, 1, line_fusion_threshold_px),
+                self._merge_lines_on_axis(vert_lines, 0, line_fusion_threshold_px))
+
+    def _merge_lines_on_axis(self, lines, position_axis, line_fusion_threshold_px):
+        '''Merges lines of one orientation. position_axis is the column holding the lines'
+        position: 1 (y1) for horizontal lines, 0 (x1) for vertical lines
+        '''
+        if len(lines) == 0:
+            return lines
+        lines = lines[np.argsort(lines[:, position_axis], kind="stable")]
+
+        #Every pass with a close pair merges at least one, so this ends after fewer passes than lines
+        while True:
+            positions = lines[:, position_axis]
+            gaps = np.diff(positions)
+            close = gaps < line_fusion_threshold_px
+            if not close.any():
+                return lines
+
+            #Pairs are taken left to right, so within a run of close gaps every other gap merges,
+            # starting with the run's first
+            gap_indices = np.arange(len(gaps))
+            last_far_gap = np.maximum.accumulate(np.where(close, -1, gap_indices))
+            merges = close & ((gap_indices - last_far_gap) % 2 == 1)
+
+            #A merged line keeps the first line's span, moved halfway to the second line. The
+            # second line is dropped
+            merged_positions = positions[:-1][merges] + gaps[merges]//2
+            lines = lines.copy()
+            lines[:-1][merges, position_axis] = lines[:-1][merges, position_axis + 2] = merged_positions
+            lines = lines[~np.concatenate(([False], merges))]
 
     def show_lines(self, horiz_lines, vert_lines, image):
         # cv2.imshow("image", image)
         # cv2.waitKey()
-        if horiz_lines:
+        if len(horiz_lines) > 0:
             for x1, y1, x2, y2 in horiz_lines:
                 cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        if vert_lines:
+        if len(vert_lines) > 0:
             for x1, y1, x2, y2 in vert_lines:
                 cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
         # cv2.imshow("image", image)
@@ -10,16 +10,15 @@ from ocirs.table_extraction.borderless_table_extraction import get_borderless_ta
 
 
 
-#NEED some way to remove these imports if some flag is set
-try:
-    from ocirs.table_detection.cascadetabnet import define_model, cascadetabnet_crop_table
-    exists_cascadetabnet = True
-except:
-    print("Error importing CascadeTabNet. Table detection will be unavailable")
-    exists_cascadetabnet = False
+#Table detection backends (CascadeTabNet and its mmdet/torch stack) are only imported when first used
+from ocirs.table_detection import registry as detection_registry
 
 
-def extract_tables(image, ocr_dataframe=None, use_cascadetabnet=False, table_type="bordered", extraction_method="custom"):
+#Number of images passed to CascadeTabNet in a single inference call
+CASCADETABNET_BATCH_SIZE = 8
+
+
+def extract_tables(image, ocr_dataframe=None, use_cascadetabnet=False, table_type="bordered", extraction_method="custom", orientation=None, bordered_method="oi", tds_batched_ocr=False):
     '''
     The primary function for extracting tables from an image. All other functions in this file all called through this master function.
 
@@ -30,71 +29,114 @@ def extract_tables(image, ocr_dataframe=None, use_cascadetabnet=False, table_typ
     * use_cascadetabnet: A True/False flag to let the user specify whether they want to use CascadeTabNet to detect tables and crop the original image down to just that image 
     * table_type: Either "bordered" or "borderless" tells the function what kind of table extraction method to use.
     * extraction_method: Either "custom" or "pdfplumber". Right now only custom will work
+    * orientation: The image's rotation as found by image_utils.detect_orientation(). Detected here if not provided
+    * bordered_method: Either "oi" or "tds", the extractor used for bordered tables. "oi" (default) finds the table's ruling lines and places the ocr'd words between them (open-intelligence). "tds" finds the table's cells from its ruling lines and fills each with the ocr'd words inside it (Towards Data Science)
+    * tds_batched_ocr: A True/False flag. When "tds" has to ocr a table's cells itself (tables cropped by CascadeTabNet have no ocr data), ocr them together in a few tesseract calls instead of one call per cell. Off by default, see bordered_table_extraction_TDS.get_box_texts_from_ocr()
+    '''
+
+    return extract_tables_batch([image], [ocr_dataframe], use_cascadetabnet, table_type, extraction_method, [orientation], bordered_method, tds_batched_ocr)[0]
+
+
+def extract_tables_batch(images, ocr_dataframes=None, use_cascadetabnet=False, table_type="bordered", extraction_method="custom", orientations=None, bordered_method="oi", tds_batched_ocr=False):
+    '''
+    Batch version of extract_tables(). Takes lists of images, ocr dataframes and orientations (all optional but images) and returns one list of table dataframes per image.
+
+    Images are processed CASCADETABNET_BATCH_SIZE at a time. Each batch is preprocessed, searched for tables and extracted before the next batch is preprocessed, so only one batch of working images is held in memory.
+    With use_cascadetabnet=True, each batch is one inference call, using the model loaded once per process by the "cascadetabnet" detection backend
+    '''
+    ocr_dataframes = [None] * len(images) if ocr_dataframes is None else list(ocr_dataframes)
+    if orientations is None:
+        orientations = [None] * len(images)
+
+    table_dataframe_lists = []
+    for batch_start in range(0, len(images), CASCADETABNET_BATCH_SIZE):
+        batch_end = batch_start + CASCADETABNET_BATCH_SIZE
+        table_dataframe_lists += _extract_tables_from_batch(images[batch_start:batch_end], ocr_dataframes[batch_start:batch_end],
+                                                            use_cascadetabnet, table_type, orientations[batch_start:batch_end], bordered_method,
+                                                            tds_batched_ocr)
+
+    ##########################
+    # Our returned data structure will be a list of pandas dataframes per image
+    # Each dataframe corresponds to one table detected on the page
+    ###########################
+
+
+    return table_dataframe_lists
+
+
+def _extract_tables_from_batch(images, ocr_dataframes, use_cascadetabnet, table_type, orientations, bordered_method, tds_batched_ocr=False):
+    '''
+    Extracts tables from one batch of extract_tables_batch() images. Returns one list of table dataframes per image
     '''
 
     ###########################
-    # First, load and preprocess image
+    # First, load and preprocess images
     ###########################
-    preprocessed_image = table_preprocess(image)
+    preprocessed_images = [table_preprocess(image, orientation) for image, orientation in zip(images, orientations)]
 
     ###########################
-    # If use_cascadetabnet=True, run CascadeTabNet process to detect the table(s) and crop the image down
-    # Returns a list of tuples. Each tuple represnets a detected table and consists of two components.
+    # If use_cascadetabnet=True, run CascadeTabNet process to detect the table(s) and crop the images down
+    # Returns a list of tuples per image. Each tuple represnets a detected table and consists of two components.
     # First a numpy-array representation of the cropped table image. Second an assertion of whether the table is bordered or borderless
     ###########################
     if use_cascadetabnet: 
       
-        #Throw exception if cascadetabnet is unavailable
-        if not exists_cascadetabnet:
-            raise Exception("Error establishing CascadeTabNet process. Make sure all relevant dependances are installed, or set `use_cascadetabnet=False`.")
-       
-
-        #First define the model that will be used to detect tables in the image
-        model = define_model()
-        #Then run wrapper function that detects, labels and crops tables from image
-        table_list = cascadetabnet_crop_table(model, cv2.cvtColor(preprocessed_image, cv2.COLOR_GRAY2RGB)) #NOTE:Trouble running mmdet on 1-channel greyscale image, making cv2.COLOR_GRAY2RGB necessary
+        #Import CascadeTabNet. Throws exception if it is unavailable
+        detection_backend = detection_registry.get_backend("cascadetabnet")
+
+        #First get the model that will be used to detect tables in the images. Only loaded on first use
+        model = detection_backend.get_model()
+        #Then run wrapper function that detects, labels and crops tables from images
+        #NOTE:mmdet needs a 3 channel image for detection. Tables are cropped from the greyscale image
+        # with the same bounds, so crops don't need converting back
+        detected_table_lists = detection_backend.crop_tables_batch(model,
+                                                    [cv2.cvtColor(image, cv2.COLOR_GRAY2RGB) for image in preprocessed_images],
+                                                    crop_images=preprocessed_images)
+
+        table_lists = []
+        for index, table_list in enumerate(detected_table_lists):
         
-        if table_list: #If cascadetabenet actually detects a table
-            # IMPORTANT
-            # Wipe the original ocr_dataframe. Since we're croping the image, we'll need new text data 
-            # That new text data will be added via `get_text_boxes()``
-            ocr_dataframe = None
+            if table_list: #If cascadetabenet actually detects a table
+                # IMPORTANT
+                # Wipe the original ocr_dataframe. Since we're croping the image, we'll need new text data 
+                # That new text data will be added via `get_text_boxes()``
+                ocr_dataframes[index] = None
+
+                #Set table type if user requests
+                table_list = [(table_image, table_type if table_type != "detect" else detected_table_type)
+                                for table_image, detected_table_type in table_list]
 
-            #Iterate through list of returned tuples. Set image back to greyscale. Set table type if user requests
-            for index,table_tuple in enumerate(table_list):
-                table_list[index] = (cv2.cvtColor(table_list[index][0], cv2.COLOR_RGB2GRAY), table_type if table_type != "detect" else table_list[index][1])
+            else: #If no table is detected, just run with the original image
+                table_list = [(preprocessed_images[index],"borderless" if table_type=='detect' else table_type)]              
 
-        else: #If no table is detected, just run with the original image
-            table_list = [(preprocessed_image,"borderless" if table_type=='detect' else table_type)]              
+            table_lists.append(table_list)
 
     ###################
-    # Else, just power ahead with the original preprocessed image
+    # Else, just power ahead with the original preprocessed images
     # But standardize the output so we can move forward with the same data structure
     ###################
     else:
-        table_list = [(preprocessed_image,table_type)]
+        table_lists = [[(preprocessed_image,table_type)] for preprocessed_image in preprocessed_images]
 
 
     #############################
     # Finally, iterate through each image (cropped or uncropped) and enter the 
     # table extraction process for the specified table type 
     ############################
-    table_dataframes = []
-    for table_tuple in table_list:
-        if table_tuple[1] == "bordered":
-            # dataframe = get_bordered_table_TDS(table_tuple[0], ocr_dataframe)
-            dataframe = get_bordered_table_OI(table_tuple[0], ocr_dataframe)
-        elif table_tuple[1] == "borderless":
-            dataframe = get_borderless_table(table_tuple[0], ocr_dataframe)
-
-        table_dataframes.append(dataframe)
-
-    
-    ##########################
-    # Our returned data structure will be a list of pandas dataframes
-    # Each dataframe corresponds to one table detected on the page
-    ###########################
-
-
-    return table_dataframes
-
+    table_dataframe_lists = []
+    for table_list, ocr_dataframe in zip(table_lists, ocr_dataframes):
+        table_dataframes = []
+        for table_tuple in table_list:
+            if table_tuple[1] == "bordered":
+                if bordered_method == "tds":
+                    dataframe = get_bordered_table_TDS(table_tuple[0], ocr_dataframe, batched=tds_batched_ocr)
+                else:
+                    dataframe = get_bordered_table_OI(table_tuple[0], ocr_dataframe)
+            elif table_tuple[1] == "borderless":
+                dataframe = get_borderless_table(table_tuple[0], ocr_dataframe)
+
+            table_dataframes.append(dataframe)
+
+        table_dataframe_lists.append(table_dataframes)
+
+    return table_dataframe_lists
@@ -9,10 +9,18 @@ def validate_extract_pages_save_path(save_path):
                         Please provide a valid directory to save_path""")
 
 def validate_extract_pages_save_type(save_type):
-    if save_type not in ("csv","pickle"):
-        raise ValueError(f"""Please provide a valid extension to save_type: 'csv' or 'pickle'. 
+    if save_type not in ("csv","pickle","parquet","arrow"):
+        raise ValueError(f"""Please provide a valid extension to save_type: 'csv', 'pickle', 'parquet' or 'arrow'. 
                             Current save_type argument {save_type}""")
 
+def validate_extract_pages_workers(workers, executor):
+    if workers is not None and (not isinstance(workers, int) or workers < 1):
+        raise ValueError(f"`workers` must be a positive integer or None. Recieved {workers}")
+
+    if executor not in ("process", "thread"):
+        raise ValueError(f"""Please provide a valid worker pool to executor: 'process' or 'thread'.
+                            Current executor argument {executor}""")
+
 ###############################
 # For NineNinetyForm().load_pages() method
 ###############################
@@ -20,10 +28,18 @@ def validate_load_pages_list_length(data_paths_list, page_index_list):
     if len(data_paths_list) != len(page_index_list):
         raise Exception("`data_paths_list` and `page_index_list` must be of the same length")
 
+def validate_load_pages_store_path(store_path):
+    if pathlib.Path(store_path).suffix not in (".parquet", ".arrow"):
+        raise ValueError(f"""A single data path must be a '.parquet' or '.arrow' ocr store saved by
+                            extract_pages(). Recieved {store_path}""")
+    if not pathlib.Path(store_path).is_file():
+        raise FileNotFoundError(f"OCR store does not exist at {store_path}")
+
 ###############################
 # For NineNinetyPage().extract_tables() method
 ###############################
-def validate_extract_tables_settings(use_cascadetabnet, table_type, extraction_method):
+def validate_extract_tables_settings(use_cascadetabnet, table_type, extraction_method, bordered_method="oi",
+    correct_orientation=True, tds_batched_ocr=False):
 
     if not isinstance(use_cascadetabnet, bool):
         raise TypeError(f"`use_cascadetabnet` must be boolean value. Recieved {use_cascadetabnet}")
@@ -37,6 +53,16 @@ def validate_extract_tables_settings(use_cascadetabnet, table_type, extraction_m
         raise Exception(f"""`table_type` cannot be '{table_type}' if `use_cascadetabnet=False`, 
                         please specify either 'bordered' or 'borderless'.""")
 
+    if bordered_method not in ("oi", "tds"):
+        raise ValueError(f"""bordered_method must be set to one of 'oi' or 'tds'.
+                        Recieved '{bordered_method}'""")
+
+    if not isinstance(correct_orientation, bool):
+        raise TypeError(f"`correct_orientation` must be boolean value. Recieved {correct_orientation}")
+
+    if not isinstance(tds_batched_ocr, bool):
+        raise TypeError(f"`tds_batched_ocr` must be boolean value. Recieved {tds_batched_ocr}")
+
 #################################
 # General validators
 #################################
@@ -46,6 +72,14 @@ def validate_form_component(form_component, valid_form_components):
                          NineNinetyForm. To view available form components: 
                          `NineNinetyForm.valid_form_components`""")
 
+def validate_search_mode(search_mode, pages):
+    if search_mode not in ("full", "header"):
+        raise ValueError(f"""search_mode must be set to one of 'full' or 'header'.
+                        Recieved '{search_mode}'""")
+
+    if search_mode == "header" and pages is not None:
+        raise ValueError("`pages` cannot be searched with `search_mode='header'`. Header search ocr's its own pages.")
+
 def validate_page_attribute(nineninetyformobj):
     if not hasattr(nineninetyformobj, "pages"):
         raise AttributeError("""'NineNinetyForm' instance has no attribute 'pages'. Try calling
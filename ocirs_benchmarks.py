@@ -0,0 +1,254 @@
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from ocirs import NineNinetyPage
+from ocirs.image_utils import table_preprocess, ocr_preprocess
+from ocirs.ocr_cache import get_ocr_cache, set_ocr_cache
+from ocirs.ocr_backends import PytesseractBackend, TesserocrBackend, set_ocr_backend
+from ocirs.table_extraction.borderless_table_extraction import get_text_boxes, get_clustering_indexes
+from ocirs.table_extraction.line_detector.line_detector import LineDetector
+from ocirs.table_extraction.bordered_table_extraction_TDS import get_box_texts_from_ocr
+
+try: #Only used to check the clustering benchmark against the hierarchical clustering it replaced
+    from scipy.cluster.hierarchy import fclusterdata
+except ImportError:
+    fclusterdata = None
+
+
+def benchmark(function, *args, repeat=10):
+    '''Returns the best run time (seconds) and the peak memory allocated (bytes) of function(*args)
+    '''
+    run_times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function(*args)
+        run_times.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    function(*args)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return min(run_times), peak_bytes
+
+def print_comparison(name, before, after):
+    print(f"{name}: {before[0]*1000:.1f}ms / {before[1]/1024**2:.1f}MB -> "
+            f"{after[0]*1000:.1f}ms / {after[1]/1024**2:.1f}MB "
+            f"({before[0]/after[0]:.1f}x time, {before[1]/max(after[1], 1):.1f}x memory)")
+
+
+#####################################
+# Greyscale image pipeline. Compares the old color round trips (GRAY -> RGB -> rotate -> GRAY, and
+# an RGB copy of the ocr image) with the single channel pipeline
+####################################
+page_image = cv2.imread("test_files/Charles Koch Institute_2013_25.jpg", cv2.IMREAD_GRAYSCALE)
+
+def table_preprocess_rgb_round_trip(image, orientation):
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    (h, w) = rgb_image.shape[:2]
+    angle = 360 - orientation
+    rotation_matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    rad = np.deg2rad(angle)
+    new_w, new_h = (abs(np.sin(rad)*h) + abs(np.cos(rad)*w), abs(np.sin(rad)*w) + abs(np.cos(rad)*h))
+    rotation_matrix[0, 2] += (new_w - w) / 2
+    rotation_matrix[1, 2] += (new_h - h) / 2
+    rotated_image = cv2.warpAffine(rgb_image, rotation_matrix, dsize=(int(new_w), int(new_h)))
+    greyscaled_image = cv2.cvtColor(rotated_image, cv2.COLOR_BGR2GRAY)
+    return cv2.threshold(greyscaled_image, 128, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+
+def ocr_preprocess_rgb_round_trip(image):
+    thresholded_image = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+    return cv2.cvtColor(thresholded_image, cv2.COLOR_BGR2RGB)
+
+print(f"Page image {page_image.shape}, {page_image.nbytes/1024**2:.1f}MB")
+for orientation in (0, 90):
+    print_comparison(f"table_preprocess, orientation {orientation}",
+                        benchmark(table_preprocess_rgb_round_trip, page_image, orientation),
+                        benchmark(table_preprocess, page_image, orientation))
+print_comparison("ocr_preprocess",
+                    benchmark(ocr_preprocess_rgb_round_trip, page_image),
+                    benchmark(ocr_preprocess, page_image))
+
+
+#####################################
+# Import time budget. `import ocirs` should cost little beyond its core dependencies (pandas, cv2,
+# pytesseract) and must not import table detection backends (mmdet, torch, mmcv)
+####################################
+IMPORT_TIME_BUDGET = 1.5 #seconds, cumulative cost of `import ocirs`
+OWN_IMPORT_TIME_BUDGET = 0.1 #seconds, spent in ocirs modules themselves
+DETECTION_MODULES = ("mmdet", "torch", "mmcv")
+
+def measure_import_time():
+    '''Imports ocirs in a fresh interpreter. Returns the cumulative import time, the time spent in
+    ocirs modules and any detection modules that were imported
+    '''
+    import_check = f"import ocirs, sys; print([m for m in {DETECTION_MODULES} if m in sys.modules])"
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", import_check],
+                                capture_output=True, text=True, check=True)
+
+    total_us, own_us = 0, 0
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        if module.strip().startswith("ocirs"):
+            own_us += int(self_us)
+        if module.strip() == "ocirs":
+            total_us = int(cumulative_us)
+
+    return total_us / 1e6, own_us / 1e6, process.stdout.strip()
+
+import_time, own_import_time, detection_modules = min(measure_import_time() for _ in range(3))
+print(f"import ocirs: {import_time:.2f}s (budget {IMPORT_TIME_BUDGET}s), "
+        f"in ocirs modules: {own_import_time*1000:.0f}ms (budget {OWN_IMPORT_TIME_BUDGET*1000:.0f}ms), "
+        f"detection modules imported: {detection_modules}")
+if import_time > IMPORT_TIME_BUDGET or own_import_time > OWN_IMPORT_TIME_BUDGET or detection_modules != "[]":
+    print("Import time budget exceeded!")
+
+
+#####################################
+# Text box geometry. Compares the old row-wise `apply` implementation of get_text_boxes() with
+# the columnar one on the ocr data of the test_files pages (ocr'ed once, then read from the ocr cache)
+####################################
+def get_text_boxes_row_apply(image, ocr_dataframe):
+    boxes = ocr_dataframe.copy()
+    boxes["conf"] = boxes["conf"].apply(lambda x: int(x))
+    boxes = boxes[boxes.conf > 0.6]
+    boxes['text'] = boxes["text"].apply(lambda x: x.strip())
+    boxes = boxes[boxes.text != ""]
+    boxes.drop(["level", "page_num", "block_num", "par_num", "line_num", "word_num", "conf"], axis=1, inplace=True)
+    boxes = boxes.reset_index(drop=True)
+    if not boxes.empty:
+        boxes["y_middle"] = boxes.apply(lambda row: row.top + int(row.height/2), axis=1)
+        boxes["y2"] = boxes.apply(lambda row: row.top + row.height, axis=1)
+        boxes["x_middle"] = boxes.apply(lambda row: row.left + int(row.width/2) , axis=1)
+        boxes["x2"] = boxes.apply(lambda row: row.left + row.width, axis=1)
+    return boxes
+
+for image_path in ("test_files/Charles Koch Institute_2013_25.jpg", "test_files/Sarah Scaife Foundation_2015_36.jpg"):
+    ocr_dataframe = NineNinetyPage(image_path).ocr_dataframe
+    print(f"{image_path}: {len(ocr_dataframe)} ocr rows")
+    print_comparison("get_text_boxes",
+                        benchmark(get_text_boxes_row_apply, None, ocr_dataframe),
+                        benchmark(get_text_boxes, None, ocr_dataframe))
+
+
+#####################################
+# 1-D clustering used by assign_rows()/assign_columns(). Compares scipy's single linkage
+# hierarchical clustering (quadratic memory, so only run up to 5k boxes) with sort-and-split
+# clustering up to 50k boxes, and checks both give identical cluster indexes
+####################################
+def get_clustering_indexes_hierarchical(list_data, max_distance):
+    clusters = fclusterdata(list_data, t=max_distance, criterion='distance')
+    clusters_to_indexes = dict()
+    for cluster_number in clusters:
+        clusters_to_indexes.setdefault(cluster_number, len(clusters_to_indexes))
+    return [clusters_to_indexes[cluster_number] for cluster_number in clusters]
+
+random_generator = np.random.default_rng(0)
+for box_count in (1000, 5000, 10000, 50000):
+    #Word x positions on a page 3400 pixels wide, scaled so clusters stay about as dense
+    x_middles = random_generator.integers(0, 3400 * max(1, box_count // 1000), box_count).reshape(-1, 1)
+    sort_and_split = benchmark(get_clustering_indexes, x_middles, 60, repeat=3)
+    if fclusterdata is not None and box_count <= 5000:
+        hierarchical = benchmark(get_clustering_indexes_hierarchical, x_middles, 60, repeat=3)
+        identical = get_clustering_indexes(x_middles, 60) == get_clustering_indexes_hierarchical(x_middles, 60)
+        print_comparison(f"get_clustering_indexes, {box_count} boxes (identical: {identical})",
+                            hierarchical, sort_and_split)
+    else:
+        print(f"get_clustering_indexes, {box_count} boxes: {sort_and_split[0]*1000:.1f}ms / "
+                f"{sort_and_split[1]/1024**2:.1f}MB")
+
+
+#####################################
+# Line detection. Compares the Hough and morphology methods of LineDetector on the test_files pages,
+# with the pages' text masked out as in table extraction. Recall is the share of Hough lines with a
+# morphology line of the same orientation within LINE_RECALL_DISTANCE pixels
+####################################
+LINE_RECALL_DISTANCE = 10
+
+def line_recall(reference_lines, found_lines, axis):
+    if len(reference_lines) == 0:
+        return 1.0
+    found_positions = np.array([line[axis] for line in found_lines])
+    return np.mean([len(found_positions) > 0 and np.abs(found_positions - line[axis]).min() <= LINE_RECALL_DISTANCE
+                        for line in reference_lines])
+
+for image_path in ("test_files/Charles Koch Institute_2013_25.jpg", "test_files/Charles Koch Institute_2013_25_cropped_bordered.jpg",
+                    "test_files/Sarah Scaife Foundation_2015_36.jpg", "test_files/Sarah Scaife Foundation_2015_36_cropped_borderless.jpg"):
+    page = NineNinetyPage(image_path)
+    table_image = table_preprocess(page.image, page.orientation)
+    text_boxes = get_text_boxes(table_image, None)
+    hough_detector, morphology_detector = LineDetector(method="hough"), LineDetector(method="morphology")
+
+    hough_horiz_lines, hough_vert_lines = hough_detector.detect_lines(table_image, text_boxes)
+    morphology_horiz_lines, morphology_vert_lines = morphology_detector.detect_lines(table_image, text_boxes)
+    print(f"{image_path}: {len(hough_horiz_lines)}/{len(hough_vert_lines)} hough lines, "
+            f"{len(morphology_horiz_lines)}/{len(morphology_vert_lines)} morphology lines (horizontal/vertical), "
+            f"recall {line_recall(hough_horiz_lines, morphology_horiz_lines, 1):.2f}/"
+            f"{line_recall(hough_vert_lines, morphology_vert_lines, 0):.2f}")
+    print_comparison("LineDetector.detect_lines",
+                        benchmark(hough_detector.detect_lines, table_image, text_boxes, repeat=3),
+                        benchmark(morphology_detector.detect_lines, table_image, text_boxes, repeat=3))
+
+
+#####################################
+# TDS cell ocr. Compares one tesseract call per cell with cells stacked onto a few canvases, on the
+# cells of the cropped bordered test table. The ocr cache is turned off so every call runs tesseract
+####################################
+table_image = table_preprocess(cv2.imread("test_files/Charles Koch Institute_2013_25_cropped_bordered.jpg", cv2.IMREAD_GRAYSCALE), 0)
+line_image = cv2.threshold(table_image, 128, 255, cv2.THRESH_BINARY)[1]
+contours, _ = cv2.findContours(line_image, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+cell_boxes = [list(cv2.boundingRect(contour)) for contour in contours]
+cell_boxes = [cell_box for cell_box in cell_boxes if 20 < cell_box[2] < 1000 and 20 < cell_box[3] < 500]
+
+saved_ocr_cache = get_ocr_cache()
+set_ocr_cache(None)
+per_cell_texts = get_box_texts_from_ocr(cell_boxes, table_image, batched=False)
+batched_texts = get_box_texts_from_ocr(cell_boxes, table_image, batched=True)
+same_text = sum(" ".join(per_cell_texts[cell].split()) == batched_texts[cell] for cell in per_cell_texts)
+print(f"{len(cell_boxes)} cells, same text in {same_text}")
+print_comparison("get_box_texts_from_ocr",
+                    benchmark(get_box_texts_from_ocr, cell_boxes, table_image, False, repeat=1),
+                    benchmark(get_box_texts_from_ocr, cell_boxes, table_image, True, repeat=1))
+set_ocr_cache(saved_ocr_cache)
+
+
+#####################################
+# Ocr backends. Compares a tesseract process per call (pytesseract) with an engine kept loaded in
+# process (tesserocr, skipped if not installed) on the test_files pages and the test table's
+# cells, and checks both return the same ocr data. The ocr cache is turned off
+####################################
+try:
+    tesserocr_backend = TesserocrBackend()
+except ImportError:
+    tesserocr_backend = None
+
+if tesserocr_backend is not None:
+    pytesseract_backend = PytesseractBackend()
+    saved_ocr_cache = get_ocr_cache()
+    set_ocr_cache(None)
+
+    for image_path in ("test_files/Charles Koch Institute_2013_25.jpg", "test_files/Sarah Scaife Foundation_2015_36.jpg"):
+        ocr_image = ocr_preprocess(cv2.imread(image_path, cv2.IMREAD_GRAYSCALE))
+        identical = pytesseract_backend.image_to_data(ocr_image, "--oem 3 --psm 1").equals(
+                        tesserocr_backend.image_to_data(ocr_image, "--oem 3 --psm 1"))
+        print_comparison(f"image_to_data, {image_path} (identical: {identical})",
+                            benchmark(pytesseract_backend.image_to_data, ocr_image, "--oem 3 --psm 1", repeat=1),
+                            benchmark(tesserocr_backend.image_to_data, ocr_image, "--oem 3 --psm 1", repeat=1))
+
+    cell_runs = []
+    for ocr_backend in (pytesseract_backend, tesserocr_backend):
+        set_ocr_backend(ocr_backend)
+        cell_runs.append(benchmark(get_box_texts_from_ocr, cell_boxes, table_image, False, repeat=1))
+    print_comparison(f"get_box_texts_from_ocr, {len(cell_boxes)} cells one by one", *cell_runs)
+
+    set_ocr_backend(pytesseract_backend)
+    set_ocr_cache(saved_ocr_cache)
@@ -7,11 +7,242 @@ from ocirs.table_extraction.table_merge import merge_dataframes, clean_dataframe
 
 
 import cv2
+import numpy as np
 import pandas as pd
 import pathlib
+import pytesseract
 
+import gc
+import os
+import tempfile
 import time
 
+from ocirs.image_utils import table_preprocess
+from ocirs.ocr_store import write_ocr_store, read_ocr_store
+from ocirs.ocr_backends import PytesseractBackend, get_ocr_backend, set_ocr_backend
+from ocirs.ocr_cache import get_ocr_cache, set_ocr_cache
+from ocirs.table_extraction.table_extraction import extract_tables
+from ocirs.raster_cache import RasterCache
+from ocirs.table_extraction.borderless_table_extraction import get_text_boxes, assign_rows, assign_columns, split_columns_on_vert_lines, get_borderless_table
+from ocirs.table_extraction.line_detector.line_detector import LineDetector
+
+#################################
+# Regression tests. Each test is a function, so they can be run with pytest
+# (`pytest ocirs_tests.py`) or by running this file, which runs them before the examples below
+#################################
+class StandInOcrBackend(PytesseractBackend):
+    '''Ocr backend for tests that can't run tesseract. Words are the blobs of dark pixels on the
+    image, and every page reports the same orientation. Counts the ocr calls and orientation
+    detections run
+    '''
+    def __init__(self, orientation=0):
+        self.orientation = orientation
+        self.orientation_detections = 0
+        self.image_to_data_calls = 0
+        self.image_to_string_calls = 0
+
+    def image_to_data(self, image, config="", output_type=pytesseract.Output.DATAFRAME):
+        self.image_to_data_calls += 1
+        _, binary_image = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(cv2.dilate(binary_image, np.ones((3, 15), np.uint8)))
+        words = [dict(level=5, page_num=1, block_num=1, par_num=1, line_num=1, word_num=word_num,
+                        left=left, top=top, width=width, height=height, conf=90.0, text=f"w{word_num}")
+                    for word_num, (left, top, width, height, _) in enumerate(stats[1:], 1)
+                    if width <= 400 and 8 <= height <= 60]
+        ocr_dataframe = pd.DataFrame(words, columns=["level", "page_num", "block_num", "par_num", "line_num",
+                                                    "word_num", "left", "top", "width", "height", "conf", "text"])
+        return ocr_dataframe.to_dict("list") if output_type == pytesseract.Output.DICT else ocr_dataframe
+
+    def image_to_string(self, image, config=""):
+        self.image_to_string_calls += 1
+        self.image_to_data_calls -= 1 #Not an image_to_data call of its own
+        return " ".join(self.image_to_data(image, config)["text"])
+
+    def detect_orientation(self, image):
+        self.orientation_detections += 1
+        return self.orientation
+
+def stand_in_page(image_path, ocr_backend):
+    '''NineNinetyPage of a test image with ocr data from a StandInOcrBackend
+    '''
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    return NineNinetyPage(image_path, ocr_dataframe=ocr_backend.image_to_data(image))
+
+def test_split_columns_on_vert_lines():
+    '''Splitting borderless columns on vertical lines (Sarah Scaife Foundation 2015, page 36). The
+    split must update the existing text boxes in place (no rows added), keep column numbers
+    consecutive, and leave every split column with all of its boxes on one side of each vertical
+    line that ran through the original column. Needs tesseract
+    '''
+    page_obj = NineNinetyPage("test_files/Sarah Scaife Foundation_2015_36_cropped_borderless.jpg", index=None)
+    table_image = table_preprocess(page_obj.image, page_obj.orientation)
+    text_boxes = assign_columns(assign_rows(get_text_boxes(table_image, None)))
+    original_columns = text_boxes["column"].copy()
+    _, vert_lines = LineDetector().detect_lines(table_image, text_boxes, "vertical")
+
+    split_text_boxes = split_columns_on_vert_lines(table_image, text_boxes.copy())
+
+    assert split_text_boxes.index.equals(text_boxes.index)
+    assert sorted(split_text_boxes["column"].unique()) == list(range(split_text_boxes["column"].max() + 1))
+    for column, column_boxes in split_text_boxes.groupby("column"):
+        assert original_columns[column_boxes.index].nunique() == 1 #A split column comes from a single column
+        original_column_boxes = text_boxes[original_columns == original_columns[column_boxes.index[0]]]
+        for x1, _, _, _ in vert_lines:
+            if original_column_boxes["left"].min() < x1 <= original_column_boxes["x2"].max():
+                assert (column_boxes["x2"] >= x1).all() or (column_boxes["x2"] < x1).all()
+    print(f"Split {original_columns.nunique()} columns into {split_text_boxes['column'].nunique()}")
+
+    table = get_borderless_table(table_image)
+    print(table)
+
+def test_merge_nearby_lines():
+    '''Merging nearby lines. Lines are merged in pairs, pass by pass, so runs of lines spaced less
+    than line_fusion_threshold_px apart keep their spacing rather than chaining into a single line,
+    and lines at least the threshold apart are left alone. Once merged, no two lines (the last one
+    included) are closer than the threshold
+    '''
+    def horizontal_lines(positions):
+        return np.array([(0, position, 100, position) for position in positions])
+
+    merged_horiz_lines, _ = LineDetector()._merge_nearby_lines(horizontal_lines([351, 361, 376]), np.empty((0, 4), dtype=int))
+    assert list(merged_horiz_lines[:, 1]) == [351, 361, 376]
+    merged_horiz_lines, _ = LineDetector()._merge_nearby_lines(horizontal_lines([351, 356, 361, 366, 371, 376]), np.empty((0, 4), dtype=int))
+    assert list(merged_horiz_lines[:, 1]) == [353, 363, 373]
+    _, merged_vert_lines = LineDetector()._merge_nearby_lines(np.empty((0, 4), dtype=int),
+                                                                np.array([(position, 0, position, 100) for position in [0, 3, 6, 9, 12, 30, 31]]))
+    assert list(merged_vert_lines[:, 0]) == [8, 30]
+    assert (np.diff(merged_vert_lines[:, 0]) >= 10).all()
+    print(f"Merged 6 close lines into {len(merged_horiz_lines)}")
+
+def test_blank_page_text():
+    '''Page text of a blank page, where tesseract returns only structural rows (conf -1) and no words
+    '''
+    ocr_dataframe = pd.DataFrame({"level": [1, 2], "conf": [-1, -1], "text": [np.nan, np.nan],
+                                    "left": [0, 0], "top": [0, 0], "width": [100, 100], "height": [100, 100]})
+    page_obj = NineNinetyPage("test_files/Charles Koch Institute_2013_25_cropped_bordered.jpg",
+                                ocr_dataframe=ocr_dataframe)
+
+    assert NineNinetyPage.dataframe_to_text(ocr_dataframe) == ""
+    assert page_obj.ocr_dataframe_to_text() == ""
+    assert page_obj.text_span_to_rows(0, 0).empty
+    print("Blank page text is empty")
+
+def test_ocr_store_round_trip():
+    '''Columnar ocr store. `conf` must read back exactly as written, and pages without any ocr rows
+    must read back as empty dataframes rather than going missing. Needs pyarrow
+    '''
+    ocr_dataframe = pd.DataFrame({"level": [5, 5, 1], "left": [12, 40, 0], "conf": [96.583912, 33.123456789, -1.0],
+                                    "text": ["Grants", "paid", np.nan]})
+    pages = [NineNinetyPage("test_files/Charles Koch Institute_2013_25_cropped_bordered.jpg", index=page_index,
+                            ocr_dataframe=page_dataframe)
+                for page_index, page_dataframe in enumerate([ocr_dataframe, ocr_dataframe.iloc[0:0]])]
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        for save_type in ("parquet", "arrow"):
+            store_path = os.path.join(store_dir, f"ocr_store.{save_type}")
+            write_ocr_store(pages, store_path, save_type)
+
+            ocr_dataframes = read_ocr_store(store_path)
+            assert list(ocr_dataframes) == [0, 1]
+            assert ocr_dataframes[0]["conf"].tolist() == ocr_dataframe["conf"].tolist()
+            assert ocr_dataframes[1].empty and list(ocr_dataframes[1].columns) == list(ocr_dataframe.columns)
+            assert list(read_ocr_store(store_path, page_index_list=[1])) == [1]
+    print("Ocr store round trip kept conf values and empty pages")
+
+def test_orientation_correction():
+    '''Pages are rotated right-way up by default. Orientation is detected once per page however many
+    times its tables are extracted, and not at all with `correct_orientation=False`
+    '''
+    previous_ocr_backend = get_ocr_backend()
+    try:
+        ocr_backend = StandInOcrBackend(orientation=0)
+        set_ocr_backend(ocr_backend)
+        page_obj = stand_in_page("test_files/Charles Koch Institute_2013_25_cropped_bordered.jpg", ocr_backend)
+
+        upright_tables = page_obj.extract_tables()
+        assert page_obj.extract_tables()[0].equals(upright_tables[0])
+        assert ocr_backend.orientation_detections == 1
+
+        unrotated_page = stand_in_page("test_files/Charles Koch Institute_2013_25_cropped_bordered.jpg", ocr_backend)
+        assert unrotated_page.extract_tables(correct_orientation=False)[0].equals(upright_tables[0])
+        assert ocr_backend.orientation_detections == 1
+
+        #A page reported upside down is turned over before extraction
+        ocr_backend.orientation = 180
+        flipped_page = stand_in_page("test_files/Charles Koch Institute_2013_25_cropped_bordered.jpg", ocr_backend)
+        flipped_page.image = cv2.rotate(flipped_page.image, cv2.ROTATE_180)
+        assert flipped_page.extract_tables()[0].shape == upright_tables[0].shape
+    finally:
+        set_ocr_backend(previous_ocr_backend)
+    print(f"Extracted a {upright_tables[0].shape} table with one orientation detection")
+
+def test_tds_batched_cell_ocr():
+    '''Batched cell ocr of "tds" tables without ocr data, such as tables cropped by CascadeTabNet.
+    `tds_batched_ocr=True` must reach the cell ocr, ocr the cells with a few canvas ocr calls
+    instead of one call per cell, and fill the same cells as per cell ocr
+    '''
+    table_image = cv2.imread("test_files/Charles Koch Institute_2013_25_cropped_bordered.jpg", cv2.IMREAD_GRAYSCALE)
+    previous_ocr_backend, previous_ocr_cache = get_ocr_backend(), get_ocr_cache()
+    set_ocr_cache(None) #Count every ocr call
+    try:
+        per_cell_backend = StandInOcrBackend()
+        set_ocr_backend(per_cell_backend)
+        per_cell_table = extract_tables(table_image, None, orientation=0, bordered_method="tds")[0]
+
+        batched_backend = StandInOcrBackend()
+        set_ocr_backend(batched_backend)
+        batched_table = extract_tables(table_image, None, orientation=0, bordered_method="tds", tds_batched_ocr=True)[0]
+    finally:
+        set_ocr_backend(previous_ocr_backend)
+        set_ocr_cache(previous_ocr_cache)
+
+    assert per_cell_backend.image_to_string_calls > 0 and per_cell_backend.image_to_data_calls == 0
+    assert batched_backend.image_to_string_calls == 0
+    assert 0 < batched_backend.image_to_data_calls < per_cell_backend.image_to_string_calls
+    assert batched_table.shape == per_cell_table.shape
+    assert ((batched_table.map(str.strip) != "") == (per_cell_table.map(str.strip) != "")).all().all()
+    print(f"Ocr'd a {batched_table.shape} table's cells with {batched_backend.image_to_data_calls} batched calls "
+            f"instead of {per_cell_backend.image_to_string_calls}")
+
+def test_raster_cache_eviction():
+    '''Raster cache eviction. Pages handed out before an eviction must still load afterwards, and
+    the decoded .npy copies of `image_cache="mmap"` pages must not count towards the cache's size
+    limit. They're deleted along with their page image instead
+    '''
+    with tempfile.TemporaryDirectory() as cache_dir:
+        page_images = [np.random.default_rng(page_index).integers(0, 256, (300, 300), dtype=np.uint8)
+                        for page_index in range(4)]
+        page_paths = [RasterCache(cache_dir).page_path("pdfhash", 300, page_index) for page_index in range(4)]
+        for page_index, (page_image, page_path) in enumerate(zip(page_images, page_paths)):
+            cv2.imwrite(str(page_path), page_image)
+            os.utime(page_path, (1000 + page_index, 1000 + page_index)) #Page 0 is least recently used
+
+        #Room for two and a half page images
+        cache = RasterCache(cache_dir, max_bytes=int(2.5 * page_paths[0].stat().st_size))
+
+        #Hand out pages 0 and 1, decode them to .npy files, then evict while requesting page 3
+        pages = [NineNinetyPage(page_paths[page_index], ocr_dataframe=pd.DataFrame(), image_cache="mmap")
+                    for page_index in (0, 1)]
+        for page in pages:
+            page.image
+        cache.evict(keep={page_paths[3]})
+        gc.collect() #Free the loaded images so they're read from disk again
+
+        assert not page_paths[2].exists() #The only page image that is neither in use nor requested
+        for page_index, page in enumerate(pages):
+            assert np.array_equal(page.image, page_images[page_index])
+            assert page_paths[page_index].with_name(page_paths[page_index].name + ".npy").is_file()
+
+        #Once pages 0 and 1 are dropped, only page 0 needs evicting, along with its .npy file
+        del pages, page
+        gc.collect()
+        cache.evict(keep={page_paths[3]})
+
+        assert sorted(os.listdir(cache_dir)) == sorted([page_paths[1].name, page_paths[1].name + ".npy",
+                                                        page_paths[3].name])
+    print("Raster cache eviction kept in use pages loadable")
+
+
 #################################
 # Test instantiation of NineNinetyForm object
 #################################
@@ -66,10 +297,20 @@ import time
 ###################################
 # Test extracting table from specific NineNinetyPage object using custom extraction
 ###################################
-page_obj = NineNinetyPage("test_files/Charles Koch Institute_2013_25.jpg", index=None)
-# print(page_obj.ocr_dataframe)
-results = page_obj.extract_tables(use_cascadetabnet=True,table_type="detect",extraction_method="custom")
-results[0].to_csv("test_output.csv", index=False)
+if __name__ == "__main__":
+    #Tests that need no tesseract run first
+    test_merge_nearby_lines()
+    test_blank_page_text()
+    test_ocr_store_round_trip()
+    test_orientation_correction()
+    test_tds_batched_cell_ocr()
+    test_raster_cache_eviction()
+    test_split_columns_on_vert_lines()
+
+    page_obj = NineNinetyPage("test_files/Charles Koch Institute_2013_25.jpg", index=None)
+    # print(page_obj.ocr_dataframe)
+    results = page_obj.extract_tables(use_cascadetabnet=True,table_type="detect",extraction_method="custom")
+    results[0].to_csv("test_output.csv", index=False)
 # page_obj = NineNinetyPage("Sarah Scaife Foundation_2014_38.jpg")
 # page_obj.extract_tables(use_cascadetabnet=False,table_type="borderless",extraction_method="custom")
 